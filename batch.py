@@ -0,0 +1,193 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from math_segments import SEGMENTS_VERSION
+
+# Question bank files picked up from a directory
+INPUT_EXTENSIONS = ('.json', '.jsonl')
+# Reports written next to an output (<output>.patch.jsonl, .quarantine.jsonl,
+# .divergences.jsonl), never picked up as question banks
+REPORT_SUFFIXES = ('.patch', '.quarantine', '.divergences')
+
+# Default data directory: data/ at the repository root
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+
+def is_report(path: str) -> bool:
+    return os.path.splitext(path)[0].endswith(REPORT_SUFFIXES)
+
+
+def expand_inputs(specs: Sequence[str], include: Callable[[str], bool] = lambda path: True) -> List[str]:
+    """Resolve files, directories and glob patterns into a sorted file list.
+
+    Directories contribute their top-level .json/.jsonl files and glob
+    patterns their matches, in both cases only files that pass `include`.
+    Hidden files such as manifests and the reports written next to outputs
+    are skipped; explicitly named files are always kept.
+    """
+    found: Dict[str, None] = {}
+    for spec in specs:
+        if os.path.isdir(spec):
+            for name in sorted(os.listdir(spec)):
+                path = os.path.join(spec, name)
+                if (not name.startswith('.') and name.endswith(INPUT_EXTENSIONS)
+                        and not is_report(path) and os.path.isfile(path) and include(path)):
+                    found[path] = None
+        elif glob.has_magic(spec):
+            for path in sorted(glob.glob(spec)):
+                if os.path.isfile(path) and not is_report(path) and include(path):
+                    found[path] = None
+        elif os.path.isfile(spec):
+            found[spec] = None
+        else:
+            raise FileNotFoundError(spec)
+    return list(found)
+
+
+def input_files(parser: argparse.ArgumentParser, specs: Sequence[str],
+                include: Callable[[str], bool] = lambda path: True) -> List[str]:
+    """expand_inputs() for a command line, where a missing input (a typo, or
+    no data/ in a fresh checkout) is a usage error rather than a traceback."""
+    try:
+        return expand_inputs(specs, include)
+    except FileNotFoundError as e:
+        parser.error(f"no such file or directory: {e}")
+
+
+def output_path(input_file: str, suffix: str, output_dir: Optional[str] = None,
+                replace_suffix: Optional[str] = None) -> str:
+    """mock1.json -> mock1<suffix>.json, optionally swapping an existing suffix
+    (mock1_cleaned.json -> mock1_fixed.json) and moving it to output_dir."""
+    stem, ext = os.path.splitext(input_file)
+    if replace_suffix and stem.endswith(replace_suffix):
+        stem = stem[:-len(replace_suffix)]
+    path = stem + suffix + ext
+    if output_dir:
+        path = os.path.join(output_dir, os.path.basename(path))
+    return path
+
+
+def add_output_arguments(parser: argparse.ArgumentParser, suffix: str,
+                         shard_dir: bool = False) -> None:
+    """-o/--output, --output-dir for <name><suffix>.json outputs, --force and
+    --compact, plus --shard-dir if `shard_dir`; see check_output_arguments()
+    and output_version()."""
+    parser.add_argument('-o', '--output',
+                        help="output file (single input only)")
+    parser.add_argument('--output-dir',
+                        help=f"directory for <name>{suffix}.json outputs (default: next to each input)")
+    if shard_dir:
+        parser.add_argument('--shard-dir',
+                            help="write each input as a <name>.jsonl shard in this directory and "
+                                 "keep its index.json of byte offsets per order_num up to date "
+                                 "(see shards.py)")
+    parser.add_argument('--force', action='store_true',
+                        help="rebuild every file even if it is up to date")
+    parser.add_argument('--compact', action='store_true',
+                        help="write one unindented question per line (orjson when installed) "
+                             "instead of the pretty-printed array")
+
+
+def check_output_arguments(parser: argparse.ArgumentParser, args: argparse.Namespace,
+                           inputs: Sequence[str]) -> None:
+    """Reject add_output_arguments() options that do not fit `inputs`."""
+    if getattr(args, 'shard_dir', None) and (args.output or args.output_dir):
+        parser.error("--shard-dir replaces --output and --output-dir")
+    if args.output and len(inputs) != 1:
+        parser.error("--output needs exactly one input file")
+
+
+def output_version(rules_version: str, args: argparse.Namespace) -> str:
+    """The manifest version of outputs built by `rules_version` with `args`:
+    every option that changes the output bytes is part of it."""
+    version = rules_version
+    if getattr(args, 'segments', False):
+        version += '+' + SEGMENTS_VERSION
+    if args.compact:
+        version += '+compact'
+    # Quarantined fields make the output depend on the budget
+    if getattr(args, 'field_budget', None) is not None:
+        version += '+guarded'
+    return version
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class Manifest:
+    """Record of what each output file was built from.
+
+    One manifest lives in each output directory and maps output file names
+    to the input path, input hash, rule version and output hash of the last
+    build, so unchanged files can be skipped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def is_current(self, input_file: str, output_file: str, version: str) -> bool:
+        entry = self.entries.get(os.path.basename(output_file))
+        return (
+            entry is not None
+            and entry['input'] == os.path.abspath(input_file)
+            and entry['version'] == version
+            and os.path.exists(output_file)
+            and entry['input_sha256'] == file_sha256(input_file)
+            and entry['output_sha256'] == file_sha256(output_file)
+        )
+
+    def record(self, input_file: str, output_file: str, version: str) -> None:
+        self.entries[os.path.basename(output_file)] = {
+            'input': os.path.abspath(input_file),
+            'input_sha256': file_sha256(input_file),
+            'version': version,
+            'output_sha256': file_sha256(output_file),
+        }
+
+    def save(self) -> None:
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+
+
+def build_all(jobs: Sequence[Tuple[str, str]], build: Callable[[str, str], None], version: str,
+              manifest_name: str, force: bool = False) -> Tuple[int, int]:
+    """Run build(input, output) for every job whose input, output or rule
+    version changed since the last recorded build.
+
+    Returns (built, skipped).
+    """
+    manifests: Dict[str, Manifest] = {}
+    built = skipped = 0
+    for input_file, output_file in jobs:
+        directory = os.path.dirname(os.path.abspath(output_file))
+        if directory not in manifests:
+            manifests[directory] = Manifest(os.path.join(directory, manifest_name))
+        manifest = manifests[directory]
+
+        if not force and manifest.is_current(input_file, output_file, version):
+            print(f"  Up to date: {output_file}")
+            skipped += 1
+            continue
+
+        os.makedirs(directory, exist_ok=True)
+        build(input_file, output_file)
+        manifest.record(input_file, output_file, version)
+        # Save as we go so an interrupted batch keeps finished files
+        manifest.save()
+        built += 1
+
+    print(f"✓ Built {built} file(s), {skipped} up to date")
+    return built, skipped
@@ -0,0 +1,227 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from clean_cfa_data import CLEANING_ENGINE, clean_text_field
+from fix_dollar_signs import FIX_ENGINE, fix_dollar_signs
+from question_io import TEXT_FIELDS, QuestionWriter
+
+DEFAULT_SIZES = [1800, 18000, 180000]
+
+# Vocabulary for the synthetic corpus, shaped after the OCR output of the mocks
+SUBJECTS = [
+    'the company', 'the portfolio manager', 'an analyst', 'the bond', 'the fund',
+    'the investor', 'the firm', 'the equity', 'the forward contract', 'the swap dealer',
+]
+VERBS = [
+    'reported', 'estimated', 'purchased', 'sold', 'expects', 'calculated',
+    'recognized', 'hedged', 'issued', 'holds',
+]
+OBJECTS = [
+    'a coupon of', 'net income of', 'a dividend of', 'a market value of',
+    'an unrealized loss of', 'a yield to maturity of', 'capital expenditures of',
+    'an interest rate of', 'a forward price of', 'a duration of',
+]
+JOINED_WORDS = [
+    'portfolioreturn', 'interestrate', 'marketvalue', 'bondprice', 'riskpremium',
+    'dividendyield', 'theValue', 'andThe', 'therefore', 'becauseThe', 'yearThe',
+    'profitmargin', 'equityholders', 'thesecond', 'the refore', 'infor mation',
+]
+LATEX = [
+    '\\times', 'times', '\\frac{1}{2}', '\\sigma', 'sigma', '\\approx', '~',
+    '^{\\sim}', '\\sqrt{2}', '\\\\\\\\beta', 'alpha', '\\gamma',
+]
+FORMULAS = [
+    'Z_{12}=00.0882', 'PV=(PMT+FV)/(1+Z)', '(1+r)^{20}', 'X_{1}', 'a^{2}',
+    'FV/PV', '(X+Y)/(1+Z)', '$80=100/(1+r)$^{20}$', 'Z=00.0882', '=10.267',
+    '$90=100/(1+Z_{12})^{12} 100/90=(1+Z_{12})^{12}$', '0.$11/0$.08', '1.0.0.5',
+]
+SHORT_OPTIONS = [
+    'Increase', 'Decrease', 'No change', 'Higher', 'Lower', 'Unchanged',
+    'Only I', 'Both I and II', 'Neither', 'Forward contract', 'Futures contract',
+    'Swap', 'Equity method', 'Acquisition method', 'Proportionate consolidation',
+]
+
+
+def _amount(rng: random.Random) -> str:
+    value = rng.choice(['{:,}', '{}', '{:.1f}', '{:.2f}']).format(
+        rng.choice([rng.randint(1, 999), rng.randint(1000, 99999), round(rng.random() * 100, 2)]))
+    return rng.choice([
+        '$' + value, '$[' + str(rng.randint(1, 99)) + ']', '[$' + value + ' million]',
+        value + 'million', '$' + value + ' billion', 'Year $' + str(rng.randint(1, 5)),
+        value + '%', 'O' + str(rng.randint(1, 9)), '0' + str(rng.randint(100, 999)),
+    ])
+
+
+def _sentence(rng: random.Random) -> str:
+    parts = [rng.choice(SUBJECTS), rng.choice(VERBS), rng.choice(OBJECTS), _amount(rng)]
+    for _ in range(rng.randint(0, 3)):
+        parts.append(rng.choice([
+            rng.choice(JOINED_WORDS), rng.choice(LATEX), rng.choice(FORMULAS),
+            _amount(rng), 'in $ millions', 'and', 'for the year',
+        ]))
+    sentence = ' '.join(parts)
+    return sentence[0].upper() + sentence[1:] + rng.choice(['.', '.', '?', ' .', ','])
+
+
+def _paragraph(rng: random.Random, low: int, high: int) -> str:
+    return ' '.join(_sentence(rng) for _ in range(rng.randint(low, high)))
+
+
+def generate_question(rng: random.Random, order_num: int) -> Dict[str, Any]:
+    """One synthetic question in the question bank schema."""
+    question = {'order_num': order_num, 'question_text': _paragraph(rng, 1, 4)}
+    for letter in 'abc':
+        if rng.random() < 0.6:
+            question['option_' + letter] = rng.choice(SHORT_OPTIONS)
+        elif rng.random() < 0.5:
+            question['option_' + letter] = _amount(rng)
+        else:
+            question['option_' + letter] = _sentence(rng)
+    question['correct_option'] = rng.choice('ABC')
+    for letter in 'abc':
+        question['explanation_' + letter] = _paragraph(rng, 1, 6)
+    return question
+
+
+def generate_corpus(count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Deterministic stream of `count` synthetic questions."""
+    rng = random.Random(seed)
+    for order_num in range(1, count + 1):
+        yield generate_question(rng, order_num)
+
+
+def _latency_stats(latencies: List[float], total: float) -> Dict[str, float]:
+    latencies.sort()
+    count = len(latencies)
+    return {
+        'seconds': round(total, 4),
+        'fields_per_sec': round(count / total, 1) if total else None,
+        'p50_us': round(latencies[count // 2] * 1e6, 2) if count else None,
+        'p99_us': round(latencies[min(count - 1, int(count * 0.99))] * 1e6, 2) if count else None,
+    }
+
+
+def peak_rss_kb() -> Optional[int]:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def run_size(count: int, seed: int = 0, stages: bool = True) -> Dict[str, Any]:
+    """Benchmark the cleaner and fixer over `count` generated questions.
+
+    Questions are generated and dropped one at a time so memory reflects the
+    cleaner, not the corpus.
+    """
+    clock = time.perf_counter
+    clean_latencies: List[float] = []
+    fix_latencies: List[float] = []
+    end_to_end: List[float] = []
+    stage_seconds = {stage.name: 0.0 for stage in CLEANING_ENGINE.stages}
+    characters = 0
+
+    for question in generate_corpus(count, seed):
+        for field in TEXT_FIELDS:
+            text = question.get(field)
+            if not isinstance(text, str):
+                continue
+            characters += len(text)
+
+            start = clock()
+            cleaned = clean_text_field(text)
+            middle = clock()
+            fix_dollar_signs(cleaned)
+            end = clock()
+            clean_latencies.append(middle - start)
+            fix_latencies.append(end - middle)
+            end_to_end.append(end - start)
+
+            if stages and text:
+                for stage in CLEANING_ENGINE.stages:
+                    start = clock()
+                    text = stage.apply(text)
+                    stage_seconds[stage.name] += clock() - start
+
+    clean_total = sum(clean_latencies)
+    result = {
+        'questions': count,
+        'fields': len(clean_latencies),
+        'characters': characters,
+        'clean_text_field': _latency_stats(clean_latencies, clean_total),
+        'fix_dollar_signs': _latency_stats(fix_latencies, sum(fix_latencies)),
+        'end_to_end': _latency_stats(end_to_end, sum(end_to_end)),
+    }
+    if stages:
+        fields = len(clean_latencies)
+        result['stages'] = {
+            name: {
+                'seconds': round(seconds, 4),
+                'share': round(seconds / sum(stage_seconds.values()), 4) if seconds else 0.0,
+                'mean_us': round(seconds / fields * 1e6, 2) if fields else None,
+            }
+            for name, seconds in stage_seconds.items()
+        }
+    result['peak_rss_kb'] = peak_rss_kb()
+    return result
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark clean_text_field, its stages and fix_dollar_signs on a "
+                    "synthetic question corpus. Prints a JSON report.")
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help="comma separated question counts (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-stages', action='store_true',
+                        help="skip the per-stage timing pass")
+    parser.add_argument('-o', '--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--write-corpus', metavar='PATH',
+                        help="only write the corpus for the first size to PATH (.json or .jsonl)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+
+    if args.write_corpus:
+        with QuestionWriter(args.write_corpus) as writer:
+            for question in generate_corpus(sizes[0], args.seed):
+                writer.write(question)
+        print(f"✓ Wrote {writer.count} synthetic questions to {args.write_corpus}")
+        return
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cleaning_version': CLEANING_ENGINE.version,
+        'fix_version': FIX_ENGINE.version,
+        'seed': args.seed,
+        'results': [],
+    }
+    for size in sizes:
+        print(f"Benchmarking {size} questions...", file=sys.stderr)
+        # A fresh process per size keeps peak RSS figures independent
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            report['results'].append(pool.submit(run_size, size, args.seed, not args.no_stages).result())
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,257 +1,252 @@
-import json
+import argparse
+import os
 import re
-from typing import Dict, List, Any
+from bisect import bisect_left
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional
 
-def fix_dollar_brackets(text: str) -> str:
-    """Fix $[25] to $25 and similar patterns."""
-    if not text:
-        return text
-    
+from batch import (
+    DATA_DIR, add_output_arguments, build_all, check_output_arguments, expand_inputs, input_files,
+    output_path, output_version,
+)
+from field_cache import DEFAULT_MAX_BYTES, FieldCache, add_cache_arguments
+from math_mode import PLACEHOLDER, math_delimiters
+from question_io import (
+    TEXT_FIELDS, AnyQuestion, QuestionWriter, dump_questions, iter_questions, load_questions,
+)
+from near_duplicates import SIGNATURES_NAME, report_near_duplicates
+from question_patch import add_patch_arguments, with_patch
+from rule_engine import (
+    FunctionRule, LiteralReplacer, Rule, RuleEngine, Stage, active_guard, active_profiler,
+    add_guard_arguments, add_profile_arguments, alternation, disable_guard, disable_profiling,
+    enable_guard, enable_profiling, guard_settings, guarded, prefix_free_groups, run_splitter,
+)
+from shards import shard_path, with_index
+from watcher import POLL_SECONDS, QuestionMemo, watch
+
+# All rules are compiled once at import and shared by every call below.
+# Stage triggers let CLEANING_ENGINE skip stages that cannot match a field;
+# every rule of a stage needs at least one of them in the text.
+
+# Shared triggers
+DIGIT = re.compile(r'\d')
+
+DOLLAR_BRACKETS = Stage('fix_dollar_brackets', [
     # Remove brackets after dollar signs: $[25] -> $25
-    text = re.sub(r'\$\[(\d+(?:\.\d+)?)\]', r'$\1', text)
+    Rule('dollar_bracket', r'\$\[(\d+(?:\.\d+)?)\]', r'$\1'),
     # Remove brackets around amounts: [$3 million] -> $3 million
-    text = re.sub(r'\[(\$\d+(?:\.\d+)?)\s*(million|billion|thousand)?\]', r'\1 \2', text)
+    Rule('bracketed_amount', r'\[(\$\d+(?:\.\d+)?)\s*(million|billion|thousand)?\]', r'\1 \2'),
     # Fix standalone bracketed numbers
-    text = re.sub(r'\[(\$?\d+(?:\.\d+)?)\]', r'\1', text)
-    
-    return text
+    Rule('bracketed_number', r'\[(\$?\d+(?:\.\d+)?)\]', r'\1'),
+], triggers=['['])
 
-def fix_tilde_and_approx(text: str) -> str:
-    """Fix tilde symbols used for approximation."""
-    if not text:
-        return text
-    
+def fix_dollar_brackets(text: str) -> str:
+    """Fix $[25] to $25 and similar patterns."""
+    return DOLLAR_BRACKETS.apply(text)
+
+TILDE_AND_APPROX = Stage('fix_tilde_and_approx', [
     # Fix ~2.7% to ≈ 2.7% or just space
     # In financial context, ~ is often approximation
-    text = re.sub(r'\^?\{?\\sim\}?', r' \\approx ', text)
-    text = re.sub(r'~', r' \\approx ', text)
-    text = re.sub(r'\\gamma', ' ', text)  # Sometimes gamma is mistakenly used
-    
-    return text
+    Rule('sim_to_approx', r'\^?\{?\\sim\}?', r' \\approx '),
+    Rule('tilde_to_approx', r'~', r' \\approx '),
+    Rule('drop_gamma', r'\\gamma', ' '),  # Sometimes gamma is mistakenly used
+], triggers=['\\sim', '~', '\\gamma'])
 
-def fix_missing_spaces(text: str) -> str:
-    """Fix concatenated words by adding spaces where needed."""
-    if not text:
-        return text
-    
+def fix_tilde_and_approx(text: str) -> str:
+    """Fix tilde symbols used for approximation."""
+    return TILDE_AND_APPROX.apply(text)
+
+# Common financial terms - only fix if actually concatenated
+FINANCIAL_WORDS = [
+    'profit', 'loss', 'price', 'rate', 'value', 'market', 'bond', 'fund',
+    'asset', 'stock', 'company', 'investment', 'return', 'capital', 'risk',
+    'portfolio', 'dividend', 'coupon', 'maturity', 'option', 'forward', 'swap',
+    'derivative', 'security', 'equity', 'interest', 'yield', 'duration',
+]
+
+# Common words - be more conservative
+COMMON_WORDS = [
+    'the', 'and', 'for', 'with', 'from', 'that', 'this', 'therefore', 'because', 'between',
+]
+
+MISSING_SPACES = Stage('fix_missing_spaces', [
     # Fix specific common concatenations first
-    text = re.sub(r'therefore([A-Z])', r'Therefore \1', text)
-    text = re.sub(r'however([A-Z])', r'However \1', text)
-    text = re.sub(r'million([A-Z])', r'million \1', text)
-    
+    Rule('therefore_cap', r'therefore([A-Z])', r'Therefore \1'),
+    Rule('however_cap', r'however([A-Z])', r'However \1'),
+    Rule('million_cap', r'million([A-Z])', r'million \1'),
     # Fix percentage patterns - but NOT when it's a valid percentage like "20%"
     # Only add multiplication when a word is directly attached to percentage
-    text = re.sub(r'([a-z]+)(\d+%)', r'\1 × \2', text)
-    
+    Rule('word_percent', r'([a-z]+)(\d+%)', r'\1 × \2'),
     # Fix missing spaces after numbers followed by "million" or "billion"
-    text = re.sub(r'(\d+)(million|billion)', r'\1 \2', text, flags=re.IGNORECASE)
-    
+    Rule('number_million', r'(\d+)(million|billion)', r'\1 \2', re.IGNORECASE),
     # Number followed by lowercase word (but not part of valid number format)
-    text = re.sub(r'(\d)([a-z]{4,})', r'\1 \2', text)
-    
-    # Common financial terms - only fix if actually concatenated
-    financial_patterns = [
-        (r'(\w)(million)([A-Z])', r'\1 \2 \3'),
-        (r'(\w)(billion)([A-Z])', r'\1 \2 \3'),
-        (r'(year)([A-Z])', r'\1 \2'),
-        (r'(Year)([A-Z])', r'\1 \2'),
-        (r'(profit)([a-z]{3,})', r'\1 \2'),
-        (r'(loss)([a-z]{3,})', r'\1 \2'),
-        (r'(price)([a-z]{3,})', r'\1 \2'),
-        (r'(rate)([a-z]{3,})', r'\1 \2'),
-        (r'(value)([a-z]{3,})', r'\1 \2'),
-        (r'(market)([a-z]{3,})', r'\1 \2'),
-        (r'(bond)([a-z]{3,})', r'\1 \2'),
-        (r'(fund)([a-z]{3,})', r'\1 \2'),
-        (r'(asset)([a-z]{3,})', r'\1 \2'),
-        (r'(stock)([a-z]{3,})', r'\1 \2'),
-        (r'(company)([a-z]{3,})', r'\1 \2'),
-        (r'(investment)([a-z]{3,})', r'\1 \2'),
-        (r'(return)([a-z]{3,})', r'\1 \2'),
-        (r'(capital)([a-z]{3,})', r'\1 \2'),
-        (r'(risk)([a-z]{3,})', r'\1 \2'),
-        (r'(portfolio)([a-z]{3,})', r'\1 \2'),
-        (r'(dividend)([a-z]{3,})', r'\1 \2'),
-        (r'(coupon)([a-z]{3,})', r'\1 \2'),
-        (r'(maturity)([a-z]{3,})', r'\1 \2'),
-        (r'(option)([a-z]{3,})', r'\1 \2'),
-        (r'(forward)([a-z]{3,})', r'\1 \2'),
-        (r'(swap)([a-z]{3,})', r'\1 \2'),
-        (r'(derivative)([a-z]{3,})', r'\1 \2'),
-        (r'(security)([a-z]{3,})', r'\1 \2'),
-        (r'(equity)([a-z]{3,})', r'\1 \2'),
-        (r'(interest)([a-z]{3,})', r'\1 \2'),
-        (r'(yield)([a-z]{3,})', r'\1 \2'),
-        (r'(duration)([a-z]{3,})', r'\1 \2'),
-    ]
-    
-    for pattern, replacement in financial_patterns:
-        text = re.sub(pattern, replacement, text, flags=re.IGNORECASE)
-    
-    # Common words - be more conservative
-    common_patterns = [
-        (r'(the)([A-Z])', r'\1 \2'),
-        (r'(and)([A-Z])', r'\1 \2'),
-        (r'(for)([A-Z])', r'\1 \2'),
-        (r'(with)([A-Z])', r'\1 \2'),
-        (r'(from)([A-Z])', r'\1 \2'),
-        (r'(that)([A-Z])', r'\1 \2'),
-        (r'(this)([A-Z])', r'\1 \2'),
-        (r'(therefore)([A-Z])', r'\1 \2'),
-        (r'(because)([A-Z])', r'\1 \2'),
-        (r'(between)([A-Z])', r'\1 \2'),
-    ]
-    
-    for pattern, replacement in common_patterns:
-        text = re.sub(pattern, replacement, text)
-    
-    return text
+    Rule('number_word', r'(\d)([a-z]{4,})', r'\1 \2'),
+    Rule('word_million_cap', r'(\w)(million)([A-Z])', r'\1 \2 \3', re.IGNORECASE),
+    Rule('word_billion_cap', r'(\w)(billion)([A-Z])', r'\1 \2 \3', re.IGNORECASE),
+    Rule('year_cap', r'(year)([A-Z])', r'\1 \2', re.IGNORECASE),
+    Rule('Year_cap', r'(Year)([A-Z])', r'\1 \2', re.IGNORECASE),
+    # All `(word)([a-z]{3,})` splits in one scan over the text
+    run_splitter('financial_words', FINANCIAL_WORDS, re.IGNORECASE),
+    # Each lowercase word ends right before a distinct capital letter, so the
+    # sequential per-word passes collapse into one alternation.
+    Rule('common_words', alternation(COMMON_WORDS, capture=True) + '([A-Z])', r'\1 \2'),
+], triggers=[
+    DIGIT,
+    # therefore/however/million and the common words before a capital
+    re.compile(r'[a-z][A-Z]'),
+    # The case-insensitive words, all followed by another letter
+    re.compile(alternation(FINANCIAL_WORDS + ['million', 'billion', 'year']) + '[a-z]', re.IGNORECASE),
+])
+
+def fix_missing_spaces(text: str) -> str:
+    """Fix concatenated words by adding spaces where needed."""
+    return MISSING_SPACES.apply(text)
+
+LATEX_COMMANDS = [
+    'times', 'div', 'frac', 'sqrt', 'sum', 'prod', 'int',
+    'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'theta', 'lambda', 'mu', 'sigma', 'pi',
+    'leq', 'geq', 'neq', 'approx', 'sim', 'equiv',
+    'infty', 'partial', 'nabla', 'cdot',
+    'left', 'right', 'big', 'Big',
+]
+
+LATEX = Stage('fix_latex_commands', [
+    # Fix quadruple backslashes to double (for JSON encoding).
+    # Only the backslash run changes, so commands that cannot match at the
+    # same spot (no prefix of one another) share a pass.
+    *(Rule('latex_quad_backslash', r'\\\\\\\\' + alternation(group, capture=True), r'\\\\\1')
+      for group in prefix_free_groups(LATEX_COMMANDS)),
+    # Fix standalone latex commands (not already escaped)
+    Rule('latex_add_backslash',
+         r'(?<!\\)(?<![a-zA-Z])\b' + alternation(LATEX_COMMANDS, capture=True) + r'\b(?![a-zA-Z])',
+         r'\\\1'),
+], triggers=['\\\\\\\\', re.compile(r'\b' + alternation(LATEX_COMMANDS) + r'\b')])
 
 def fix_latex_commands(text: str) -> str:
     """Fix broken LaTeX commands by adding missing backslashes."""
-    if not text:
-        return text
-    
-    # Fix already escaped but wrong number of backslashes
-    # In JSON, we need \\ to represent a single \
-    # But sometimes we have \\\\ (4) which represents \\ in the actual string
-    
-    # First, normalize: if we have single backslash before latex command, make it double
-    latex_commands = [
-        'times', 'div', 'frac', 'sqrt', 'sum', 'prod', 'int',
-        'alpha', 'beta', 'gamma', 'delta', 'epsilon', 'theta', 'lambda', 'mu', 'sigma', 'pi',
-        'leq', 'geq', 'neq', 'approx', 'sim', 'equiv',
-        'infty', 'partial', 'nabla', 'cdot',
-        'left', 'right', 'big', 'Big',
-    ]
-    
-    # Fix quadruple backslashes to double (for JSON encoding)
-    for cmd in latex_commands:
-        text = re.sub(r'\\\\\\\\' + cmd, r'\\\\' + cmd, text)
-    
-    # Fix standalone latex commands (not already escaped)
-    for cmd in latex_commands:
-        # Match the command when it's not already preceded by backslash
-        pattern = r'(?<!\\)(?<![a-zA-Z])\b' + cmd + r'\b(?![a-zA-Z])'
-        replacement = '\\\\' + cmd  # Double backslash for JSON
-        text = re.sub(pattern, replacement, text)
-    
-    return text
+    return LATEX.apply(text)
 
-def wrap_math_expressions(text: str) -> str:
-    """Wrap mathematical expressions in $ delimiters."""
-    if not text:
-        return text
-    
-    # Patterns that should be wrapped in math mode
+# Patterns that should be wrapped in math mode
+MATH_PATTERNS = [re.compile(p) for p in [
+    # Equations with = and variables (e.g., Z_{12}=0.00882)
+    r'([A-Za-z_]\{[^}]+\}\s*=\s*[0-9\.\-]+)',
+    # Variables with subscripts: X_{12}
+    r'([A-Za-z]+_\{[^}]+\})',
+    # Variables with superscripts in parentheses: (1+r)^{20}
+    r'(\([^\)]+\)\^\{[^}]+\})',
+    # Standalone superscripts
+    r'([A-Za-z0-9]+\^\{[^}]+\})',
+    # LaTeX commands (e.g., \times, \alpha, \sigma)
+    r'(\\[a-z]+(?:\{[^}]*\})?)',
+    # Fractions with /: (X+Y)/(1+Z)
+    r'(\([^)]+\)/\([^)]+\))',
+    r'([A-Za-z_0-9\{\}]+/[A-Za-z_0-9\{\}]+)',
+    # Complex expressions: equations like PV=(PMT+FV)/(1+Z)
+    r'([A-Za-z]+\s*=\s*\([^)]+\)/\([^)]+\))',
+    r'([A-Za-z]+\s*=\s*[A-Za-z0-9_\{\}\(\)]+/[A-Za-z0-9_\{\}\(\)]+)',
+]]
+
+def _wrap_math(text: str) -> str:
     # Be careful not to double-wrap things already in $...$
-    
-    def is_in_math_mode(text: str, pos: int) -> bool:
-        """Check if position is already inside $ ... $"""
-        # Count dollars before this position
-        # But skip escaped dollars (<<<DOLLAR>>>)
-        before = text[:pos]
-        # Remove placeholders before counting
-        before_no_placeholder = before.replace('<<<DOLLAR>>>', '')
-        before_no_escaped = before_no_placeholder.replace('\\\\$', '')
-        dollars_before = before_no_escaped.count('$')
-        # Odd number means we're inside math mode
-        return dollars_before % 2 == 1
-    
-    # Match various math patterns
-    patterns_to_wrap = [
-        # Equations with = and variables (e.g., Z_{12}=0.00882)
-        r'([A-Za-z_]\{[^}]+\}\s*=\s*[0-9\.\-]+)',
-        # Variables with subscripts: X_{12}
-        r'([A-Za-z]+_\{[^}]+\})',
-        # Variables with superscripts in parentheses: (1+r)^{20}
-        r'(\([^\)]+\)\^\{[^}]+\})',
-        # Standalone superscripts
-        r'([A-Za-z0-9]+\^\{[^}]+\})',
-        # LaTeX commands (e.g., \times, \alpha, \sigma)
-        r'(\\[a-z]+(?:\{[^}]*\})?)',
-        # Fractions with /: (X+Y)/(1+Z)
-        r'(\([^)]+\)/\([^)]+\))',
-        r'([A-Za-z_0-9\{\}]+/[A-Za-z_0-9\{\}]+)',
-        # Complex expressions: equations like PV=(PMT+FV)/(1+Z)
-        r'([A-Za-z]+\s*=\s*\([^)]+\)/\([^)]+\))',
-        r'([A-Za-z]+\s*=\s*[A-Za-z0-9_\{\}\(\)]+/[A-Za-z0-9_\{\}\(\)]+)',
-    ]
-    
-    result = text
-    
-    # Process each pattern
-    for pattern in patterns_to_wrap:
-        matches = list(re.finditer(pattern, result))
-        # Process in reverse to maintain positions
-        for match in reversed(matches):
+    # A position is inside math mode when an odd number of delimiters
+    # precede it. Wraps inside one pass all come after the match being
+    # checked, so the index built at the start of the pass stays valid
+    # until the text is rebuilt.
+    delimiters = None
+    
+    for pattern in MATH_PATTERNS:
+        wraps = []
+        # Start of the most recent wrap, which puts a $ right after an adjacent match
+        wrapped_start = -1
+        
+        # Process in reverse, as wrapping a match can block the one before it
+        for match in reversed(list(pattern.finditer(text))):
             start, end = match.span()
             matched_text = match.group(0)
             
+            if delimiters is None:
+                delimiters = math_delimiters(text)
+            
             # Skip if already in math mode
-            if is_in_math_mode(result, start):
+            if bisect_left(delimiters, start) % 2 == 1:
                 continue
             
             # Skip if it's just a URL or path
-            if '://' in matched_text or '<<<DOLLAR>>>' in matched_text:
+            if '://' in matched_text or PLACEHOLDER in matched_text:
                 continue
-                
+            
             # Skip if already wrapped
-            if start > 0 and result[start-1] == '$':
+            if start > 0 and text[start-1] == '$':
                 continue
-            if end < len(result) and result[end] == '$':
+            if end < len(text) and (text[end] == '$' or end == wrapped_start):
                 continue
             
-            # Wrap it
-            result = result[:start] + '$' + matched_text + '$' + result[end:]
+            wraps.append((start, end))
+            wrapped_start = start
+        
+        if not wraps:
+            continue
+        
+        # Wrap them all with a single rebuild of the text
+        pieces = []
+        pos = 0
+        for start, end in reversed(wraps):
+            pieces += [text[pos:start], '$', text[start:end], '$']
+            pos = end
+        pieces.append(text[pos:])
+        text = ''.join(pieces)
+        delimiters = None
     
+    return text
+
+WRAP_MATH = Stage('wrap_math_expressions', [
+    FunctionRule('wrap_math', _wrap_math),
     # Clean up any double dollars that might have been created
-    result = re.sub(r'\$\$+', '$', result)
-    
+    Rule('collapse_dollars', r'\$\$+', '$'),
     # Fix $$ at boundaries (change to single $)
-    result = re.sub(r'\$\s+\$', ' ', result)
-    
-    return result
+    Rule('empty_math', r'\$\s+\$', ' '),
+], triggers=['{', '\\', '/', '$'])  # every math pattern needs {, \ or /
 
-def escape_currency_dollars_first(text: str) -> str:
-    """Escape all $ signs followed by numbers (currency) BEFORE any other processing."""
-    if not text:
-        return text
-    
-    # This runs BEFORE math wrapping
-    # Escape $ followed by digit - these are always currency
-    # But be smart about context
-    
-    PLACEHOLDER = "<<<DOLLAR>>>"
-    
+def wrap_math_expressions(text: str) -> str:
+    """Wrap mathematical expressions in $ delimiters."""
+    return WRAP_MATH.apply(text)
+
+ESCAPE_CURRENCY = Stage('escape_currency_dollars_first', [
     # Special case: "Year $1" or "Year $2" is NOT currency, it's "Year 1" or "Year 2"
     # Fix this first
-    text = re.sub(r'Year \$(\d+)', r'Year \1', text)
-    text = re.sub(r'year \$(\d+)', r'year \1', text)
-    
+    Rule('Year_dollar', r'Year \$(\d+)', r'Year \1'),
+    Rule('year_dollar', r'year \$(\d+)', r'year \1'),
     # Now find all remaining $ followed by digits and replace with placeholder
-    text = re.sub(r'\$(\d)', rf'{PLACEHOLDER}\1', text)
-    
+    Rule('currency_placeholder', r'\$(\d)', rf'{PLACEHOLDER}\1'),
     # Also handle $ in common currency contexts
-    text = text.replace('in $ ', f'in {PLACEHOLDER} ')
-    text = text.replace('(in $ ', f'(in {PLACEHOLDER} ')
-    text = text.replace('in$ ', f'in{PLACEHOLDER} ')
-    text = text.replace('(in$ ', f'(in{PLACEHOLDER} ')
-    
-    return text
+    LiteralReplacer('currency_contexts', {
+        'in $ ': f'in {PLACEHOLDER} ',
+        '(in $ ': f'(in {PLACEHOLDER} ',
+        'in$ ': f'in{PLACEHOLDER} ',
+        '(in$ ': f'(in{PLACEHOLDER} ',
+    }),
+], triggers=['$'])
+
+def escape_currency_dollars_first(text: str) -> str:
+    """Escape all $ signs followed by numbers (currency) BEFORE any other processing."""
+    # This runs BEFORE math wrapping
+    # Escape $ followed by digit - these are always currency
+    return ESCAPE_CURRENCY.apply(text)
+
+RESTORE_DOLLARS = Stage('restore_escaped_dollars', [
+    # Convert placeholder to \\$ (which is \$ in the actual string, will display as $ in LaTeX)
+    LiteralReplacer('restore_placeholder', {PLACEHOLDER: '\\\\$'}),
+], triggers=[PLACEHOLDER])
 
 def restore_escaped_dollars(text: str) -> str:
     """Convert placeholder back to escaped dollars AFTER math wrapping."""
-    PLACEHOLDER = "<<<DOLLAR>>>"
-    # Convert placeholder to \\$ (which is \$ in the actual string, will display as $ in LaTeX)
-    text = text.replace(PLACEHOLDER, '\\\\$')
-    return text
+    return RESTORE_DOLLARS.apply(text)
 
-def fix_unpaired_dollars(text: str) -> str:
-    """Fix unpaired $ signs that aren't escaped."""
-    if not text:
-        return text
-    
+TIMES_WRAPPED = re.compile(r'\$\\times\$')
+APPROX_WRAPPED = re.compile(r'\$\\approx\$')
+
+def _fix_unpaired(text: str) -> str:
     # Count $ signs that are not escaped (not preceded by \\)
     # If there's an odd number, something is wrong
     
@@ -281,8 +276,8 @@ def fix_unpaired_dollars(text: str) -> str:
             
             # Pattern: $\times$ or $\approx$ at wrong positions
             # Convert standalone math symbols to wrapped ones
-            line = re.sub(r'\$\\times\$', r'$\\times$', line)
-            line = re.sub(r'\$\\approx\$', r'$\\approx$', line)
+            line = TIMES_WRAPPED.sub(r'$\\times$', line)
+            line = APPROX_WRAPPED.sub(r'$\\approx$', line)
             
             # If still odd, there might be a $ that should be escaped
             # Look for $ followed by word or at end
@@ -292,158 +287,415 @@ def fix_unpaired_dollars(text: str) -> str:
     
     return '\n'.join(result_lines)
 
-def clean_text_field(text: str) -> str:
-    """Apply all cleaning operations to a text field."""
-    if not text or not isinstance(text, str):
-        return text
-    
-    # Step 1: Fix dollar signs with brackets
-    text = fix_dollar_brackets(text)
-    
-    # Step 2: Escape currency dollars FIRST (before math wrapping)
-    text = escape_currency_dollars_first(text)
-    
-    # Step 3: Fix tilde and approximation symbols
-    text = fix_tilde_and_approx(text)
-    
-    # Step 4: Fix missing spaces
-    text = fix_missing_spaces(text)
-    
-    # Step 5: Fix LaTeX commands
-    text = fix_latex_commands(text)
-    
-    # Step 6: Wrap math expressions (will not wrap placeholders)
-    text = wrap_math_expressions(text)
-    
-    # Step 7: Restore escaped dollars from placeholders
-    text = restore_escaped_dollars(text)
-    
-    # Step 8: Fix any unpaired dollars
-    text = fix_unpaired_dollars(text)
-    
-    # Step 9: Clean up common artifacts
-    
+UNPAIRED_DOLLARS = Stage('fix_unpaired_dollars', [
+    FunctionRule('unpaired_dollars', _fix_unpaired),
+], triggers=['$'])
+
+def fix_unpaired_dollars(text: str) -> str:
+    """Fix unpaired $ signs that aren't escaped."""
+    return UNPAIRED_DOLLARS.apply(text)
+
+# Fix common broken words that got incorrectly spaced
+BROKEN_WORDS = {
+    'the re ': 'there ',
+    'the refore': 'therefore',
+    'the ir ': 'their ',
+    'the se ': 'these ',
+    'with in ': 'within ',
+    'with out ': 'without ',
+    'for ward ': 'forward ',
+    'for mula': 'formula',
+    'for egone': 'foregone',
+    'in correct': 'incorrect',
+    'share holder': 'shareholder',
+    'market place': 'marketplace',
+    'strate gy': 'strategy',
+    'othe rwise': 'otherwise',
+    'initial ly': 'initially',
+    'gathe rs': 'gathers',
+    'infor mation': 'information',
+    'theresult': 'the result',
+    'therecord': 'the record',
+    'thesecond': 'the second',
+    'thefirst': 'the first',
+    'thethird': 'the third',
+    'thelast': 'the last',
+    'Year s': 'Years',
+    'year s': 'years',
+}
+
+ARTIFACTS = Stage('cleanup_artifacts', [
     # Fix letter O used instead of zero in context (but be careful)
-    text = re.sub(r'(\s|^)O(\d)', r'\g<1>0\2', text)
-    text = re.sub(r'(\d)O(\s|$|,|\.)', r'\g<1>0\g<2>', text)
-    
-    # Fix missing decimal points for specific patterns like "0176" -> "0.176" 
+    Rule('leading_letter_o', r'(\s|^)O(\d)', r'\g<1>0\2'),
+    Rule('trailing_letter_o', r'(\d)O(\s|$|,|\.)', r'\g<1>0\g<2>'),
+    # Fix missing decimal points for specific patterns like "0176" -> "0.176"
     # But NOT "02" or "08" which might be valid
-    text = re.sub(r'\b0(\d{3,})\b', r'0.\1', text)
-    
+    Rule('missing_decimal', r'\b0(\d{3,})\b', r'0.\1'),
     # Fix patterns like "00.0267" -> "0.0267", "00.267" -> "0.0267" (missing leading digit)
     # This should cover $Z_{12}=00.0882$ and similar
-    text = re.sub(r'(\{?\w*\}?)=00\.0(\d+)', r'\1=0.00\2', text)
-    text = re.sub(r'(\{?\w*\}?)=00\.(\d{1,2}\d+)', r'\1=0.0\2', text)
-    text = re.sub(r'\s00\.0(\d+)', r' 0.00\1', text)
-    text = re.sub(r'\s00\.(\d{1,2}\d+)', r' 0.0\1', text)
-    text = re.sub(r'([^\d])00\.0(\d+)', r'\g<1>0.00\2', text)
-    text = re.sub(r'([^\d])00\.(\d{1,2}\d+)', r'\g<1>0.0\2', text)
-    
+    Rule('eq_double_zero_0', r'(\{?\w*\}?)=00\.0(\d+)', r'\1=0.00\2'),
+    Rule('eq_double_zero', r'(\{?\w*\}?)=00\.(\d{1,2}\d+)', r'\1=0.0\2'),
+    Rule('space_double_zero_0', r'\s00\.0(\d+)', r' 0.00\1'),
+    Rule('space_double_zero', r'\s00\.(\d{1,2}\d+)', r' 0.0\1'),
+    Rule('nondigit_double_zero_0', r'([^\d])00\.0(\d+)', r'\g<1>0.00\2'),
+    Rule('nondigit_double_zero', r'([^\d])00\.(\d{1,2}\d+)', r'\g<1>0.0\2'),
     # More general: Z=00.0882 -> Z=0.00882
-    text = re.sub(r'([A-Za-z_])=00\.0', r'\1=0.00', text)
-    text = re.sub(r'([A-Za-z_])=00\.', r'\1=0.0', text)
-    
+    Rule('var_double_zero_0', r'([A-Za-z_])=00\.0', r'\1=0.00'),
+    Rule('var_double_zero', r'([A-Za-z_])=00\.', r'\1=0.0'),
     # Fix patterns inside formulas more generally
-    text = re.sub(r'(\w+)=00\.0(\d+)', r'\1=0.00\2', text)
-    text = re.sub(r'(\w+)=00\.(\d+)', r'\1=0.0\2', text)
-    
+    Rule('word_double_zero_0', r'(\w+)=00\.0(\d+)', r'\1=0.00\2'),
+    Rule('word_double_zero', r'(\w+)=00\.(\d+)', r'\1=0.0\2'),
     # Fix double decimals created by overzealous replacement
-    text = re.sub(r'\b00\.', r'0.0', text)
-    
+    Rule('double_zero', r'\b00\.', r'0.0'),
     # Fix triple decimals or more
-    while re.search(r'(\d+)(\.0\.)', text):
-        text = re.sub(r'(\d+)(\.0\.)', r'\g<1>0.', text)
-    
+    Rule('triple_decimal', r'(\d+)(\.0\.)', r'\g<1>0.', fixed_point=True),
     # Fix specific numeric patterns that are wrong: 10.267 should be 1.0267
-    text = re.sub(r'=10\.(\d{3})', r'=1.0\1', text)
-    
+    Rule('ten_point', r'=10\.(\d{3})', r'=1.0\1'),
     # Remove multiple spaces
-    text = re.sub(r'  +', ' ', text)
-    
+    Rule('multiple_spaces', r'  +', ' '),
     # Clean up spaces before punctuation
-    text = re.sub(r'\s+([,\.\;\:!])', r'\1', text)
-    
-    # Fix common broken words that got incorrectly spaced
-    broken_words = {
-        'the re ': 'there ',
-        'the refore': 'therefore',
-        'the ir ': 'their ',
-        'the se ': 'these ',
-        'with in ': 'within ',
-        'with out ': 'without ',
-        'for ward ': 'forward ',
-        'for mula': 'formula',
-        'for egone': 'foregone',
-        'in correct': 'incorrect',
-        'share holder': 'shareholder',
-        'market place': 'marketplace',
-        'strate gy': 'strategy',
-        'othe rwise': 'otherwise',
-        'initial ly': 'initially',
-        'gathe rs': 'gathers',
-        'infor mation': 'information',
-        'theresult': 'the result',
-        'therecord': 'the record',
-        'thesecond': 'the second',
-        'thefirst': 'the first',
-        'thethird': 'the third',
-        'thelast': 'the last',
-        'Year s': 'Years',
-        'year s': 'years',
-    }
-    
-    for broken, fixed in broken_words.items():
-        text = text.replace(broken, fixed)
+    Rule('space_before_punct', r'\s+([,\.\;\:!])', r'\1'),
+    LiteralReplacer('broken_words', BROKEN_WORDS),
+], triggers=[
+    DIGIT,  # all numeric repairs
+    '  ',
+    re.compile(r'\s[,\.\;\:!]'),
+    re.compile(alternation(BROKEN_WORDS)),
+])
+
+# The full cleaning pipeline, in order
+CLEANING_ENGINE = RuleEngine([
+    DOLLAR_BRACKETS,    # Step 1: Fix dollar signs with brackets
+    ESCAPE_CURRENCY,    # Step 2: Escape currency dollars FIRST (before math wrapping)
+    TILDE_AND_APPROX,   # Step 3: Fix tilde and approximation symbols
+    MISSING_SPACES,     # Step 4: Fix missing spaces
+    LATEX,              # Step 5: Fix LaTeX commands
+    WRAP_MATH,          # Step 6: Wrap math expressions (will not wrap placeholders)
+    RESTORE_DOLLARS,    # Step 7: Restore escaped dollars from placeholders
+    UNPAIRED_DOLLARS,   # Step 8: Fix any unpaired dollars
+    ARTIFACTS,          # Step 9: Clean up common artifacts
+])
+
+def clean_text_field(text: str) -> str:
+    """Apply all cleaning operations to a text field."""
+    if not text or not isinstance(text, str):
+        return text
     
-    return text
+    return CLEANING_ENGINE.clean(text)
+
+# Questions per task sent to a worker process
+CHUNK_SIZE = 50
 
-def clean_question(question: Dict[str, Any]) -> Dict[str, Any]:
+# Build manifest kept in each output directory
+CLEAN_MANIFEST = '.clean_manifest.json'
+
+# Cache of cleaned fields for this process, see open_field_cache()
+field_cache: Optional[FieldCache] = None
+
+def open_field_cache(path: str, max_bytes: int = DEFAULT_MAX_BYTES) -> FieldCache:
+    """Make clean_question() reuse cleaned fields stored at `path`."""
+    global field_cache
+    field_cache = FieldCache(path, CLEANING_ENGINE.version, max_bytes)
+    return field_cache
+
+def close_field_cache() -> None:
+    """Evict down to the size limit, print hit/miss stats and stop caching."""
+    global field_cache
+    if field_cache is None:
+        return
+    field_cache.evict()
+    print(field_cache.summary())
+    field_cache.close()
+    field_cache = None
+
+def clean_cached_field(text: str) -> str:
+    """clean_text_field(), skipping text that was already cleaned by this rule set."""
+    if field_cache is None or not text or not isinstance(text, str):
+        return clean_text_field(text)
+    cleaned = field_cache.get(text)
+    if cleaned is None:
+        cleaned = clean_text_field(text)
+        field_cache.put(text, cleaned)
+    return cleaned
+
+def clean_question(question: AnyQuestion) -> AnyQuestion:
     """Clean all relevant fields in a question object."""
     cleaned = question.copy()
     
-    # Fields to clean
-    text_fields = [
-        'question_text',
-        'option_a',
-        'option_b', 
-        'option_c',
-        'explanation_a',
-        'explanation_b',
-        'explanation_c'
-    ]
-    
-    for field in text_fields:
+    for field in TEXT_FIELDS:
         if field in cleaned:
-            cleaned[field] = clean_text_field(cleaned[field])
+            cleaned[field] = guarded(clean_cached_field, cleaned[field],
+                                     question.get('order_num'), field)
+    
+    return cleaned
+
+def clean_question_batch(questions: List[AnyQuestion]) -> List[AnyQuestion]:
+    """clean_question() over a list of questions, with the rules that do not
+    need per-field context run once over all their uncached fields."""
+    if active_guard() is not None:
+        # Fields are budgeted one by one
+        return [clean_question(question) for question in questions]
+    cleaned = [question.copy() for question in questions]
+    targets = []
+    texts = []
+    for question in cleaned:
+        for field in TEXT_FIELDS:
+            text = question.get(field)
+            if not text or not isinstance(text, str):
+                continue
+            cached = field_cache.get(text) if field_cache is not None else None
+            if cached is not None:
+                question[field] = cached
+            else:
+                targets.append((question, field))
+                texts.append(text)
+    
+    for (question, field), text, result in zip(targets, texts, CLEANING_ENGINE.clean_batch(texts)):
+        question[field] = result
+        if field_cache is not None:
+            field_cache.put(text, result)
     
     return cleaned
 
-def clean_cfa_json(input_file: str, output_file: str):
-    """Main function to clean CFA exam JSON data."""
+def _init_worker(cache_path: Optional[str], cache_max_bytes: int, profile: bool = False,
+                 guard: Optional[tuple] = None) -> None:
+    if cache_path:
+        open_field_cache(cache_path, cache_max_bytes)
+    if profile:
+        enable_profiling()
+    if guard is not None:
+        enable_guard(*guard)
+
+def _clean_chunk(questions: List[Dict[str, Any]], process: Callable[..., Any], batched: bool = False):
+    """Worker entry point: clean one chunk of questions, passing the whole
+    chunk to `process` at once when `batched`.
+    
+    Returns the cleaned questions, the worker's cache (hits, misses), its
+    rule profile (or None) and its quarantined fields for this chunk, so the
+    parent can report totals.
+    """
+    cleaned = process(questions) if batched else [process(question) for question in questions]
+    profiler = active_profiler()
+    profile = profiler.take() if profiler is not None else None
+    guard = active_guard()
+    quarantined = guard.take() if guard is not None else []
+    if field_cache is None:
+        return cleaned, (0, 0), profile, quarantined
+    field_cache.flush()
+    return cleaned, field_cache.take_stats(), profile, quarantined
+
+def clean_questions(questions: Iterable[Dict[str, Any]], workers: int = 1,
+                    chunk_size: int = CHUNK_SIZE,
+                    process: Callable[[Dict[str, Any]], Any] = clean_question,
+                    batch_process: Optional[Callable[[List[Dict[str, Any]]], List[Any]]] = None
+                    ) -> Iterator[Any]:
+    """Clean questions in input order, spread over `workers` processes.
+    
+    Chunks are submitted as the input is consumed, with at most two chunks per
+    worker in flight, so streaming input stays streaming. workers=1 cleans in
+    this process. `process` (clean_question by default) must be picklable.
+    With `batch_process` (e.g. clean_question_batch), whole chunks are
+    cleaned by one call instead, in this process too.
+    """
+    if workers <= 1:
+        if batch_process is None:
+            for question in questions:
+                yield process(question)
+            return
+        chunk = []
+        for question in questions:
+            chunk.append(question)
+            if len(chunk) == chunk_size:
+                yield from batch_process(chunk)
+                chunk = []
+        if chunk:
+            yield from batch_process(chunk)
+        return
+    
+    batched = batch_process is not None
+    if batched:
+        process = batch_process
+    
+    profiler = active_profiler()
+    guard = active_guard()
+    
+    def collect(future):
+        cleaned, (hits, misses), profile, quarantined = future.result()
+        if field_cache is not None:
+            field_cache.hits += hits
+            field_cache.misses += misses
+        if profile:
+            profiler.merge(profile)
+        if quarantined:
+            guard.merge(quarantined)
+        return cleaned
+    
+    guard_settings = guard.settings() if guard is not None else None
+    if field_cache is not None:
+        # Workers open their own connection to the same cache file
+        initargs = (field_cache.path, field_cache.max_bytes, profiler is not None, guard_settings)
+    else:
+        initargs = (None, 0, profiler is not None, guard_settings)
+    
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=initargs) as pool:
+        pending = deque()
+        chunk = []
+        for question in questions:
+            chunk.append(question)
+            if len(chunk) == chunk_size:
+                pending.append(pool.submit(_clean_chunk, chunk, process, batched))
+                chunk = []
+                if len(pending) >= 2 * workers:
+                    yield from collect(pending.popleft())
+        if chunk:
+            pending.append(pool.submit(_clean_chunk, chunk, process, batched))
+        while pending:
+            yield from collect(pending.popleft())
+
+def clean_cfa_json(input_file: str, output_file: str, stream: bool = False, workers: int = 1,
+                   cache: Optional[str] = None, cache_max_bytes: int = DEFAULT_MAX_BYTES,
+                   batch: bool = False, compact: bool = False):
+    """Main function to clean CFA exam JSON data.
+    
+    With stream=True questions are read, cleaned and written one at a time
+    (JSON array or JSON Lines, by extension), so only one question is held
+    in memory. workers > 1 cleans chunks of questions in a process pool;
+    output order always matches the input. `cache` is the path of a field
+    cache reused across runs. batch=True cleans each chunk with
+    clean_question_batch(). compact=True writes one unindented question per
+    line.
+    """
+    if cache:
+        open_field_cache(cache, cache_max_bytes)
+    try:
+        _clean_cfa_json(input_file, output_file, stream, workers, batch, compact)
+    finally:
+        close_field_cache()
+
+def _clean_cfa_json(input_file: str, output_file: str, stream: bool, workers: int,
+                    batch: bool = False, compact: bool = False):
     print(f"Reading {input_file}...")
+    batch_process = clean_question_batch if batch else None
     
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    if stream:
+        with QuestionWriter(output_file, compact) as writer:
+            cleaned = clean_questions(iter_questions(input_file, records=True), workers,
+                                      batch_process=batch_process)
+            for i, cleaned_question in enumerate(cleaned, 1):
+                if i % 10 == 0:
+                    print(f"  Processed {i} questions...")
+                writer.write(cleaned_question)
+        print(f"✓ Done! {writer.count} cleaned questions saved to {output_file}")
+        return
+    
+    data = load_questions(input_file, records=True)
     
     print(f"Processing {len(data)} questions...")
     
     cleaned_data = []
-    for i, question in enumerate(data, 1):
+    cleaned = clean_questions(data, workers, batch_process=batch_process)
+    for i, cleaned_question in enumerate(cleaned, 1):
         if i % 10 == 0:
             print(f"  Processed {i}/{len(data)} questions...")
-        cleaned_question = clean_question(question)
         cleaned_data.append(cleaned_question)
     
     print(f"Writing cleaned data to {output_file}...")
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(cleaned_data, f, indent=2, ensure_ascii=False)
+    dump_questions(cleaned_data, output_file, compact)
     
     print(f"✓ Done! Cleaned data saved to {output_file}")
 
+def is_raw_bank(path: str) -> bool:
+    """Directory and glob inputs skip files this pipeline produced."""
+    stem = os.path.splitext(path)[0]
+    return not stem.endswith(('_cleaned', '_fixed'))
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Clean CFA exam JSON data. Only files whose input or rules "
+                    "changed since the last run are rebuilt.")
+    parser.add_argument('inputs', nargs='*', default=[DATA_DIR],
+                        help="input files, directories or glob patterns (default: data/)")
+    add_output_arguments(parser, '_cleaned', shard_dir=True)
+    add_patch_arguments(parser)
+    parser.add_argument('--stream', action='store_true',
+                        help="read and write one question at a time")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of cleaning processes (default: 1, in-process)")
+    parser.add_argument('--batch', action='store_true',
+                        help="run context-free rules once per chunk of questions instead of per field")
+    add_cache_arguments(parser)
+    add_profile_arguments(parser, cached=True)
+    add_guard_arguments(parser)
+    parser.add_argument('--near-duplicates', action='store_true',
+                        help="afterwards report clusters of near-duplicate questions across all "
+                             f"outputs (signatures are kept in {SIGNATURES_NAME} next to them)")
+    parser.add_argument('--watch', action='store_true',
+                        help="after the build keep running and rebuild each input as soon as it "
+                             "is saved, cleaning only the questions that changed")
+    parser.add_argument('--poll-interval', type=float, default=POLL_SECONDS,
+                        help="seconds between checks for saved files in --watch mode "
+                             "(default: %(default)s)")
+    args = parser.parse_args(argv)
+    
+    inputs = input_files(parser, args.inputs, include=is_raw_bank)
+    check_output_arguments(parser, args, inputs)
+    
+    def list_jobs():
+        if args.output:
+            return [(inputs[0], args.output)]
+        paths = expand_inputs(args.inputs, include=is_raw_bank)
+        if args.shard_dir:
+            return [(path, shard_path(path, args.shard_dir)) for path in paths]
+        return [(path, output_path(path, '_cleaned', args.output_dir)) for path in paths]
+    
+    jobs = list_jobs()
+    budget = guard_settings(parser, args)
+    version = output_version(CLEANING_ENGINE.version, args)
+    
+    def build(input_file: str, output_file: str):
+        _clean_cfa_json(input_file, output_file, args.stream, args.workers, args.batch,
+                        args.compact)
+        if guard is not None:
+            guard.write_report(output_file)
+    
+    # A save touches a few questions, not worth starting worker processes for
+    batch_process = clean_question_batch if args.batch else None
+    memo = QuestionMemo(lambda questions: clean_questions(questions, batch_process=batch_process))
+    
+    def rebuild(input_file: str, output_file: str):
+        print(f"Rebuilding {output_file}...")
+        dump_questions(memo.build(input_file), output_file, args.compact)
+        if guard is not None:
+            guard.write_report(output_file)
+    
+    if args.patch or args.patch_dir:
+        build = with_patch(build, args.patch_dir)
+        rebuild = with_patch(rebuild, args.patch_dir)
+    if args.shard_dir:
+        build = with_index(build, args.shard_dir)
+        rebuild = with_index(rebuild, args.shard_dir)
+    
+    if args.cache:
+        open_field_cache(args.cache, args.cache_size_mb * 1024 * 1024)
+    if args.profile_rules:
+        enable_profiling()
+    guard = enable_guard(*budget) if budget is not None else None
+    try:
+        build_all(jobs, build, version, CLEAN_MANIFEST, force=args.force)
+        if args.near_duplicates and jobs:
+            outputs = [output for _, output in jobs]
+            report_near_duplicates(outputs, os.path.join(
+                os.path.dirname(os.path.abspath(outputs[0])), SIGNATURES_NAME))
+        if args.watch:
+            watch(list_jobs, rebuild, version, CLEAN_MANIFEST, memo, args.poll_interval)
+    finally:
+        close_field_cache()
+        disable_guard()
+        profiler = disable_profiling()
+    if profiler is not None:
+        print(profiler.report(args.profile_sort))
+
 if __name__ == "__main__":
-    input_file = r"c:\github\she\CFA_lv1_1800_2.0\data\mock1_session2.json"
-    output_file = r"c:\github\she\CFA_lv1_1800_2.0\data\mock1_data_cleaned.json"
-    
-    clean_cfa_json(input_file, output_file)
+    main()
@@ -0,0 +1,278 @@
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from batch import DATA_DIR, input_files
+from bench_cleaner import generate_corpus
+from clean_cfa_data import CLEANING_ENGINE, is_raw_bank
+from fix_dollar_signs import FIX_ENGINE
+from question_io import TEXT_FIELDS, iter_questions
+from reference_cleaner import clean_text_field, fix_dollar_signs
+from rule_engine import RuleEngine, RuleGuard, re2
+
+# Calls to the engines allowed while shrinking one diverging input
+MINIMIZE_TESTS = 2000
+# Fields compared per candidate call, for engines that take batches
+CHUNK_FIELDS = 450
+
+TARGETS = {'clean': CLEANING_ENGINE, 'fix': FIX_ENGINE}
+# The frozen sequential functions each rule set must agree with, see
+# reference_cleaner.py
+REFERENCES: Dict[str, Callable[[str], str]] = {
+    'clean': clean_text_field,
+    'fix': fix_dollar_signs,
+}
+
+Engine = Callable[[RuleEngine, List[str]], List[str]]
+
+
+def _default(engine: RuleEngine, texts: List[str]) -> List[str]:
+    return [engine.clean(text) for text in texts]
+
+
+def _batch(engine: RuleEngine, texts: List[str]) -> List[str]:
+    return engine.clean_batch(texts)
+
+
+def _linear(engine: RuleEngine, texts: List[str]) -> List[str]:
+    guard = RuleGuard(seconds=None, linear=True)
+    results = []
+    for text in texts:
+        if text:
+            for stage in engine.stages:
+                text = guard.run_stage(stage, text)
+        results.append(text)
+    return results
+
+
+# Candidate engines, each cleaning a list of fields with a rule set
+ENGINES: Dict[str, Engine] = {
+    'default': _default,
+    'batch': _batch,
+    'linear': _linear,
+}
+
+
+def diverges(target: str, candidate: Engine, text: str) -> bool:
+    try:
+        return candidate(TARGETS[target], [text])[0] != REFERENCES[target](text)
+    except Exception:
+        return True
+
+
+def minimize(text: str, failing: Callable[[str], bool], max_tests: int = MINIMIZE_TESTS) -> str:
+    """Shrink text while failing(text) holds, by removing ever smaller
+    chunks of characters (ddmin)."""
+    tests = 0
+    granularity = 2
+    while len(text) >= 2:
+        chunk = max(1, len(text) // granularity)
+        for start in range(0, len(text), chunk):
+            smaller = text[:start] + text[start + chunk:]
+            tests += 1
+            if tests > max_tests:
+                return text
+            if smaller and failing(smaller):
+                text = smaller
+                granularity = max(granularity - 1, 2)
+                break
+        else:
+            if chunk == 1:
+                break
+            granularity = min(granularity * 2, len(text))
+    return text
+
+
+class Comparison:
+    """Field-by-field agreement of one candidate engine with the reference."""
+
+    def __init__(self, target: str, engine_name: str):
+        self.target = target
+        self.engine_name = engine_name
+        self.fields = 0
+        self.reference_seconds = 0.0
+        self.candidate_seconds = 0.0
+        self.divergences: List[Dict[str, Any]] = []
+
+    def compare(self, sources: List[Dict[str, Any]], texts: List[str], minimize_inputs: bool = True,
+                ) -> List[str]:
+        """Run both engines over texts and record where they differ.
+
+        `sources` says where each text came from (file, order_num, field).
+        Returns the reference outputs.
+        """
+        engine = TARGETS[self.target]
+        reference = REFERENCES[self.target]
+        candidate = ENGINES[self.engine_name]
+        clock = time.perf_counter
+
+        start = clock()
+        expected = [reference(text) for text in texts]
+        middle = clock()
+        try:
+            actual = candidate(engine, texts)
+        except Exception as e:
+            actual = [f'<{type(e).__name__}: {e}>'] * len(texts)
+        end = clock()
+        self.reference_seconds += middle - start
+        self.candidate_seconds += end - middle
+        self.fields += len(texts)
+
+        for source, text, want, got in zip(sources, texts, expected, actual):
+            if want == got:
+                continue
+            entry = dict(source, target=self.target, engine=self.engine_name,
+                         input=text, reference=want, candidate=got)
+            if minimize_inputs and diverges(self.target, candidate, text):
+                small = minimize(text, lambda t: diverges(self.target, candidate, t))
+                entry['reproducer'] = small
+                entry['reproducer_reference'] = reference(small)
+                entry['reproducer_candidate'] = candidate(engine, [small])[0]
+            self.divergences.append(entry)
+        return expected
+
+    def summary(self) -> str:
+        if not self.fields:
+            return f"{self.target}/{self.engine_name}: no fields compared"
+        speedup = self.reference_seconds / self.candidate_seconds if self.candidate_seconds else 0.0
+        status = '✓' if not self.divergences else '⚠'
+        return (f"{status} {self.target}/{self.engine_name}: {len(self.divergences)} of {self.fields} "
+                f"field(s) differ; reference {self.reference_seconds / self.fields * 1e6:.1f} us/field, "
+                f"candidate {self.candidate_seconds / self.fields * 1e6:.1f} us/field "
+                f"({speedup:.2f}x)")
+
+
+def sampled_fields(questions: Iterator[Tuple[str, Dict[str, Any]]], fraction: float,
+                   seed: int = 0) -> Iterator[Tuple[Dict[str, Any], str]]:
+    """(source, text) of a `fraction` of the non-empty text fields."""
+    rng = random.Random(seed)
+    for path, question in questions:
+        for field in TEXT_FIELDS:
+            text = question.get(field)
+            if isinstance(text, str) and text and (fraction >= 1 or rng.random() < fraction):
+                yield {'file': path, 'order_num': question.get('order_num'), 'field': field}, text
+
+
+def run_differential(questions: Iterator[Tuple[str, Dict[str, Any]]], engine_name: str,
+                     fraction: float = 1.0, seed: int = 0,
+                     minimize_inputs: bool = True) -> List[Comparison]:
+    """Compare `engine_name` with the reference on the cleaner and, fed the
+    reference's cleaned text, on the dollar fixer."""
+    clean = Comparison('clean', engine_name)
+    fix = Comparison('fix', engine_name)
+    sources: List[Dict[str, Any]] = []
+    texts: List[str] = []
+
+    def flush():
+        cleaned = clean.compare(sources, texts, minimize_inputs)
+        fix.compare(sources, cleaned, minimize_inputs)
+        sources.clear()
+        texts.clear()
+
+    for source, text in sampled_fields(questions, fraction, seed):
+        sources.append(source)
+        texts.append(text)
+        if len(texts) == CHUNK_FIELDS:
+            flush()
+    if texts:
+        flush()
+    return [clean, fix]
+
+
+def verify_output(input_file: str, output_file: str, targets: Sequence[str],
+                  fraction: float, seed: int = 0) -> int:
+    """Check a sampled `fraction` of a build's fields against the reference.
+
+    The output fields were produced by whatever engine, cache and options
+    the build used; the reference recomputes them from the input through
+    `targets` (('clean',) for the cleaner, ('clean', 'fix') for the
+    pipeline). Differences go to <output>.divergences.jsonl. Returns their
+    number.
+    """
+    references = [REFERENCES[target] for target in targets]
+    rng = random.Random(seed)
+    checked = 0
+    divergences = []
+    for raw, built in zip(iter_questions(input_file), iter_questions(output_file)):
+        for field in TEXT_FIELDS:
+            text = raw.get(field)
+            if not isinstance(text, str) or not text or rng.random() >= fraction:
+                continue
+            expected = text
+            for reference in references:
+                expected = reference(expected)
+            checked += 1
+            if built.get(field) != expected:
+                divergences.append({'order_num': raw.get('order_num'), 'field': field,
+                                    'input': text, 'reference': expected,
+                                    'output': built.get(field)})
+
+    path = output_file + '.divergences.jsonl'
+    if not divergences:
+        print(f"✓ {checked} sampled field(s) of {output_file} match the reference")
+        return 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for entry in divergences:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    print(f"⚠ {len(divergences)} of {checked} sampled field(s) of {output_file} differ from "
+          f"the reference, see {path}")
+    return len(divergences)
+
+
+def _corpus(args, files: List[str]) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    if args.synthetic:
+        for question in generate_corpus(args.synthetic, args.seed):
+            yield '<synthetic>', question
+        return
+    for path in files:
+        for question in iter_questions(path):
+            yield path, question
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Compare a cleaning engine with the frozen sequential cleaner and dollar "
+                    "fixer (reference_cleaner.py) field by field, shrink diverging inputs and "
+                    "time both.")
+    parser.add_argument('inputs', nargs='*', default=[DATA_DIR],
+                        help="raw question banks, directories or glob patterns (default: data/)")
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='default',
+                        help="candidate engine (default: %(default)s)")
+    parser.add_argument('--synthetic', type=int, metavar='N',
+                        help="use N generated questions (see bench_cleaner.py) instead of inputs")
+    parser.add_argument('--sample', type=float, default=1.0,
+                        help="fraction of fields to compare (default: all)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-minimize', action='store_true',
+                        help="report diverging fields as they are")
+    parser.add_argument('-o', '--output', metavar='PATH',
+                        help="write the divergences and their reproducers as JSON Lines")
+    args = parser.parse_args(argv)
+
+    if args.engine == 'linear' and re2 is None:
+        parser.error("the linear engine needs google-re2")
+    files = [] if args.synthetic else input_files(parser, args.inputs, include=is_raw_bank)
+
+    comparisons = run_differential(_corpus(args, files), args.engine, args.sample, args.seed,
+                                   not args.no_minimize)
+    print(f"Rules: clean {CLEANING_ENGINE.version}, fix {FIX_ENGINE.version}")
+    for comparison in comparisons:
+        print(comparison.summary())
+        for entry in comparison.divergences[:5]:
+            shown = entry.get('reproducer', entry['input'])
+            print(f"  {entry['file']} #{entry['order_num']} {entry['field']}: {shown[:120]!r}")
+
+    divergences = [entry for comparison in comparisons for entry in comparison.divergences]
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            for entry in divergences:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    if divergences:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
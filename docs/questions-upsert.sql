@@ -0,0 +1,7 @@
+-- Unique key used by uploader.py to upsert questions (on_conflict=exam_id,order_num)
+-- Copy và paste vào Supabase SQL Editor (https://supabase.com/dashboard → SQL Editor)
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_questions_exam_order
+  ON questions(exam_id, order_num);
+
+SELECT 'Unique index on questions(exam_id, order_num) created! ✅' as result;
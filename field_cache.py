@@ -0,0 +1,128 @@
+import argparse
+import hashlib
+import os
+import sqlite3
+import time
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Pending writes are committed in batches of this many entries
+FLUSH_EVERY = 500
+
+
+class FieldCache:
+    """On-disk cache of cleaned field text.
+
+    Entries are keyed by a hash of the input text and the cleaning pipeline
+    version, so any rule change makes old entries unreachable; they age out
+    through least-recently-used eviction once the cache exceeds `max_bytes`.
+    Several processes may share one cache file.
+    """
+
+    def __init__(self, path: str, version: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.version = version
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._pending: Dict[str, Tuple[str, int]] = {}
+        self._touched: List[str] = []
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=60)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS fields ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' size INTEGER NOT NULL,'
+            ' last_used INTEGER NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS idx_fields_last_used ON fields(last_used)')
+        self._db.commit()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f'{self.version}\0{text}'.encode('utf-8')).hexdigest()
+
+    def get(self, text: str) -> Optional[str]:
+        key = self._key(text)
+        if key in self._pending:
+            self.hits += 1
+            return self._pending[key][0]
+        row = self._db.execute('SELECT value FROM fields WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._touched.append(key)
+        return row[0]
+
+    def put(self, text: str, value: str) -> None:
+        self._pending[self._key(text)] = (value, len(text.encode('utf-8')) + len(value.encode('utf-8')))
+        if len(self._pending) >= FLUSH_EVERY:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write pending entries and last-used times."""
+        if not self._pending and not self._touched:
+            return
+        now = int(time.time())
+        with self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO fields (key, value, size, last_used) VALUES (?, ?, ?, ?)',
+                [(key, value, size, now) for key, (value, size) in self._pending.items()],
+            )
+            self._db.executemany(
+                'UPDATE fields SET last_used = ? WHERE key = ?',
+                [(now, key) for key in self._touched],
+            )
+        self._pending.clear()
+        self._touched.clear()
+
+    def take_stats(self) -> Tuple[int, int]:
+        """Return and reset the hit/miss counters (used to report worker stats)."""
+        stats = (self.hits, self.misses)
+        self.hits = self.misses = 0
+        return stats
+
+    def size(self) -> int:
+        return self._db.execute('SELECT COALESCE(SUM(size), 0) FROM fields').fetchone()[0]
+
+    def evict(self) -> int:
+        """Drop least recently used entries until the cache fits in max_bytes."""
+        self.flush()
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return 0
+        doomed = []
+        for key, size in self._db.execute('SELECT key, size FROM fields ORDER BY last_used'):
+            doomed.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        with self._db:
+            self._db.executemany('DELETE FROM fields WHERE key = ?', doomed)
+        self.evicted += len(doomed)
+        return len(doomed)
+
+    def summary(self) -> str:
+        lookups = self.hits + self.misses
+        rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return (f"Cache: {self.hits} hits, {self.misses} misses ({rate:.1f}% hit rate), "
+                f"{self.evicted} evicted, {self.size() / (1024 * 1024):.1f} MB in {self.path}")
+
+    def close(self) -> None:
+        self.flush()
+        self._db.close()
+
+
+def add_cache_arguments(parser: argparse.ArgumentParser) -> None:
+    """--cache and --cache-size-mb."""
+    parser.add_argument('--cache', metavar='PATH',
+                        help="SQLite cache of cleaned fields, reused across runs")
+    parser.add_argument('--cache-size-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="evict least recently used cache entries beyond this size")
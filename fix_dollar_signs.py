@@ -1,58 +1,70 @@
-import json
-import re
+import argparse
+import os
 
-def fix_dollar_signs(text):
-    """Fix dollar sign issues in text."""
-    if not text:
-        return text
-    
+from batch import (
+    DATA_DIR, add_output_arguments, build_all, check_output_arguments, input_files, output_path,
+    output_version,
+)
+from math_segments import add_segments, add_segments_argument, report_problems
+from question_io import TEXT_FIELDS, QuestionWriter, dump_questions, iter_questions, load_questions
+from question_patch import add_patch_arguments, with_patch
+from rule_engine import (
+    LiteralReplacer, Rule, RuleEngine, Stage, add_guard_arguments, add_profile_arguments,
+    disable_guard, disable_profiling, enable_guard, enable_profiling, guard_settings, guarded,
+)
+
+# Build manifest kept in each output directory
+FIX_MANIFEST = '.fix_manifest.json'
+
+DOLLAR_FIXES = Stage('fix_dollar_signs', [
     # Fix: $profit/loss$ -> profit/loss (these should not be in math mode)
-    text = text.replace('$profit/loss$', 'profit/loss')
+    LiteralReplacer('profit_loss_text', {'$profit/loss$': 'profit/loss'}),
     
     # Fix: $80=100 at the beginning of a formula -> wrap properly
     # Pattern: $(equation also shown as $80=100/(1+r)$^{20}$
     # Should be: (equation also shown as $80=100/(1+r)^{20}$)
-    text = re.sub(r'\$\(equation also shown as \$(\d+)=', r'(equation also shown as $\1=', text)
+    Rule('equation_shown_as', r'\$\(equation also shown as \$(\d+)=', r'(equation also shown as $\1='),
     
     # Fix: shown as 80 $100/(1+r)^{20}$.$ -> shown as $80=100/(1+r)^{20}$.)
-    text = re.sub(r'shown as (\d+) \$(\d+)/\(1\+r\)\^\{(\d+)\}\.\$', r'shown as $\1=\2/(1+r)^{\3}$)', text)
+    Rule('shown_as_split', r'shown as (\d+) \$(\d+)/\(1\+r\)\^\{(\d+)\}\.\$', r'shown as $\1=\2/(1+r)^{\3}$)'),
     
     # Fix broken formulas like: $90=100/(1+Z_{12})^{12} 100/90=(1+Z_{12})^{12}$
     # This should be: $90=100/(1+Z_{12})^{12}$, $100/90=(1+Z_{12})^{12}$
-    text = re.sub(r'(\$\d+=.+?\^\{\d+\})\s+(\d+/.+=.+?\^\{\d+\}\$)', r'\1$, $\2', text)
+    Rule('split_formula_pair', r'(\$\d+=.+?\^\{\d+\})\s+(\d+/.+=.+?\^\{\d+\}\$)', r'\1$, $\2'),
     
     # Fix: shown as $80=100/(1+r)$^{20}$ -> shown as $80=100/(1+r)^{20}$)
-    text = re.sub(r'\$(\d+)=(\d+)/\(1\+r\)\$\^\{(\d+)\}\$', r'$\1=\2/(1+r)^{\3}$)', text)
+    Rule('misplaced_exponent', r'\$(\d+)=(\d+)/\(1\+r\)\$\^\{(\d+)\}\$', r'$\1=\2/(1+r)^{\3}$)'),
     
     # Fix: Z=00.0882 -> Z=0.00882 (double zero issue)
-    text = re.sub(r'([A-Z])=00\.0(\d+)', r'\1=0.00\2', text)
-    text = re.sub(r'([A-Z]_\{\d+\})=00\.0(\d+)', r'\1=0.00\2', text)
-    text = re.sub(r'([A-Z]_\{\d+\})=00\.(\d+)', r'\1=0.0\2', text)
+    Rule('var_double_zero_0', r'([A-Z])=00\.0(\d+)', r'\1=0.00\2'),
+    Rule('subscript_double_zero_0', r'([A-Z]_\{\d+\})=00\.0(\d+)', r'\1=0.00\2'),
+    Rule('subscript_double_zero', r'([A-Z]_\{\d+\})=00\.(\d+)', r'\1=0.0\2'),
     
     # Fix: Z=0.00882. -> Z=0.00882 (remove period after number in formulas)
-    text = re.sub(r'([A-Z]=0\.\d+)\.', r'\1', text)
+    Rule('trailing_period', r'([A-Z]=0\.\d+)\.', r'\1'),
     
     # Fix: Year $1125$ -> Year 1: $125 (was incorrectly parsed)
-    text = re.sub(r'Year \$(\d)(\d{3})\$', r'Year \1: $\2', text)
+    Rule('year_amount', r'Year \$(\d)(\d{3})\$', r'Year \1: $\2'),
     
     # Fix: -$10 million 20% -> -$10 million × 20%
-    text = re.sub(r'million (\d+%)', r'million × \1', text)
-    text = re.sub(r'billion (\d+%)', r'billion × \1', text)
+    Rule('million_percent', r'million (\d+%)', r'million × \1'),
+    Rule('billion_percent', r'billion (\d+%)', r'billion × \1'),
     
     # Fix currency amounts that got escaped: \\$43 should stay as $43 in regular text
     # But in formulas keep them
     
     # Fix: $(0.10-0.02)$=0.$11/0$.08 -> $(0.10-0.02)=0.11/0.08$
-    text = re.sub(r'\$\(([0-9.+-]+)\)\$=(\d+)\.\$(\d+)/(\d+)\$\.(\d+)', r'$(\1)=\2.\3/\4.\5$', text)
+    Rule('split_ratio_formula', r'\$\(([0-9.+-]+)\)\$=(\d+)\.\$(\d+)/(\d+)\$\.(\d+)', r'$(\1)=\2.\3/\4.\5$'),
     
     # Fix: [X-F$(T)/(1+r)$] -> $[X-F(T)/(1+r)]$
-    text = re.sub(r'\[X-F\$\(T\)/\(1\+r\)\$\]', r'$[X-F(T)/(1+r)]$', text)
-    
     # Fix: $(cash equivalents... )$ -> (cash equivalents...) - not a formula
-    text = re.sub(r'\$\(cash equivalents and short-term investments\)\$', r'(cash equivalents and short-term investments)', text)
+    LiteralReplacer('literal_formulas', {
+        '[X-F$(T)/(1+r)$]': '$[X-F(T)/(1+r)]$',
+        '$(cash equivalents and short-term investments)$': '(cash equivalents and short-term investments)',
+    }),
     
     # Fix: 0.$11/0$.08 -> 0.11/0.08
-    text = re.sub(r'(\d+)\.\$(\d+)/(\d+)\$\.(\d+)', r'\1.\2/\3.\4', text)
+    Rule('split_ratio', r'(\d+)\.\$(\d+)/(\d+)\$\.(\d+)', r'\1.\2/\3.\4'),
     
     # Fix wrapped text that shouldn't be in math mode
     # $2.5+4.5+2.2=9.2$ at the end is OK
@@ -60,19 +72,50 @@ def fix_dollar_signs(text):
     # Actually \times inside text is OK, the issue is stand-alone $ around \times
     
     # Fix \\\\$ (quadruple backslash) to \\$ (double backslash for JSON)
-    text = re.sub(r'\\\\\\\\\\$', r'\\\\$', text)
+    Rule('quad_backslash_dollar', r'\\\\\\\\\\$', r'\\\\$'),
     
     # Fix: $90=100/(1+Z_{12})^{12}. -> $90=100/(1+Z_{12})^{12}$.
     # Remove periods inside formulas before closing $
-    text = re.sub(r'\.\$', r'$', text)
+    Rule('period_before_close', r'\.\$', r'$'),
+], triggers=['$', '=00.', '=0.', 'million ', 'billion ', '\\'])
+
+FIX_ENGINE = RuleEngine([DOLLAR_FIXES])
+
+def fix_dollar_signs(text):
+    """Fix dollar sign issues in text."""
+    if not text:
+        return text
     
-    return text
+    return FIX_ENGINE.clean(text)
+
+def fix_question(question):
+    """Fix all text fields of a question in place."""
+    for field in TEXT_FIELDS:
+        if field in question and question[field]:
+            question[field] = guarded(fix_dollar_signs, question[field],
+                                      question.get('order_num'), field)
+    return question
 
-def process_json_file(input_file, output_file):
+def process_json_file(input_file, output_file, stream=False, compact=False, segments=False):
     print(f"Reading {input_file}...")
-    
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    problems = []
+    
+    if stream:
+        # One question in memory at a time (JSON array or JSON Lines)
+        with QuestionWriter(output_file, compact) as writer:
+            for i, question in enumerate(iter_questions(input_file, records=True), 1):
+                if i % 10 == 0:
+                    print(f"  Processed {i} questions...")
+                fix_question(question)
+                if segments:
+                    add_segments(question, problems)
+                writer.write(question)
+        print(f"✓ Done!")
+        if segments:
+            report_problems(output_file, problems)
+        return
+    
+    data = load_questions(input_file, records=True)
     
     print(f"Processing {len(data)} questions...")
     
@@ -81,20 +124,71 @@ def process_json_file(input_file, output_file):
             print(f"  Processed {i}/{len(data)} questions...")
         
         # Fix all text fields
-        for field in ['question_text', 'option_a', 'option_b', 'option_c', 
-                      'explanation_a', 'explanation_b', 'explanation_c']:
-            if field in question and question[field]:
-                question[field] = fix_dollar_signs(question[field])
+        fix_question(question)
+        if segments:
+            add_segments(question, problems)
     
     print(f"Writing to {output_file}...")
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    dump_questions(data, output_file, compact)
     
     print(f"✓ Done!")
+    if segments:
+        report_problems(output_file, problems)
+
+def is_cleaned_bank(path):
+    """Directory and glob inputs only pick up the cleaner's outputs."""
+    return os.path.splitext(path)[0].endswith('_cleaned')
+
+def rules_version():
+    """Hash of the fix-up rules, so editing any of them triggers a rebuild."""
+    return FIX_ENGINE.version
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Fix dollar sign issues in cleaned CFA exam JSON data. Only files "
+                    "whose input or rules changed since the last run are rebuilt.")
+    parser.add_argument('inputs', nargs='*', default=[DATA_DIR],
+                        help="*_cleaned.json files, directories or glob patterns (default: data/)")
+    add_output_arguments(parser, '_fixed')
+    add_patch_arguments(parser)
+    parser.add_argument('--stream', action='store_true',
+                        help="read and write one question at a time")
+    add_segments_argument(parser)
+    add_guard_arguments(parser)
+    add_profile_arguments(parser)
+    args = parser.parse_args(argv)
+    
+    budget = guard_settings(parser, args)
+    
+    inputs = input_files(parser, args.inputs, include=is_cleaned_bank)
+    check_output_arguments(parser, args, inputs)
+    if args.output:
+        jobs = [(inputs[0], args.output)]
+    else:
+        jobs = [(path, output_path(path, '_fixed', args.output_dir, replace_suffix='_cleaned'))
+                for path in inputs]
+    
+    def build(input_file, output_file):
+        process_json_file(input_file, output_file, stream=args.stream, compact=args.compact,
+                          segments=args.segments)
+        if guard is not None:
+            guard.write_report(output_file)
+    
+    if args.patch or args.patch_dir:
+        build = with_patch(build, args.patch_dir)
+    
+    if args.profile_rules:
+        enable_profiling()
+    guard = enable_guard(*budget) if budget is not None else None
+    try:
+        build_all(jobs, build, output_version(rules_version(), args), FIX_MANIFEST,
+                  force=args.force)
+    finally:
+        disable_guard()
+        profiler = disable_profiling()
+    if profiler is not None:
+        print(profiler.report(args.profile_sort))
 
 if __name__ == "__main__":
-    input_file = r"c:\github\she\CFA_lv1_1800_2.0\data\mock1_section2_cleaned.json"
-    output_file = r"c:\github\she\CFA_lv1_1800_2.0\data\mock1_section2_fixed.json"
-    
-    process_json_file(input_file, output_file)
+    main()
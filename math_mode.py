@@ -0,0 +1,30 @@
+import re
+from typing import List
+
+# Stands in for a currency $ while the cleaner wraps math, see
+# escape_currency_dollars_first() in clean_cfa_data.py
+PLACEHOLDER = "<<<DOLLAR>>>"
+
+# Placeholders and $ signs, the only characters that decide math mode
+DOLLAR_TOKENS = re.compile(re.escape(PLACEHOLDER) + r'|\$')
+
+
+def math_delimiters(text: str) -> List[int]:
+    """Positions of the $ signs that open or close math mode.
+
+    Placeholders (<<<DOLLAR>>>) are ignored and a $ preceded by \\\\ (once
+    placeholders are removed) is an escaped dollar, not a delimiter.
+    """
+    delimiters = []
+    # Last two characters seen, with placeholders skipped
+    tail = ''
+    pos = 0
+    for token in DOLLAR_TOKENS.finditer(text):
+        start = token.start()
+        tail = (tail + text[max(pos, start - 2):start])[-2:]
+        if token.group() == '$':
+            if tail != '\\\\':
+                delimiters.append(start)
+            tail = tail[-1:] + '$'
+        pos = token.end()
+    return delimiters
@@ -0,0 +1,101 @@
+import argparse
+from typing import Any, Dict, List, Tuple
+
+from math_mode import math_delimiters
+from question_io import TEXT_FIELDS, AnyQuestion
+
+# A cleaned field as {"type": "text" | "math", "value": ...} pieces, in order.
+# Math values are the LaTeX between the $ delimiters; text values have the
+# escaped currency dollars (\\$) turned back into plain $.
+Segment = Dict[str, str]
+
+# Key of a field's segments in the output, e.g. question_text_segments
+SEGMENTS_SUFFIX = '_segments'
+# Bump when the segment format changes, so outputs built with segments rebuild
+SEGMENTS_VERSION = 'segments1'
+
+ESCAPED_DOLLAR = '\\\\$'
+
+
+def _braces_balanced(math: str) -> bool:
+    depth = 0
+    escaped = False
+    for ch in math:
+        if escaped:
+            escaped = False
+        elif ch == '\\':
+            escaped = True
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth < 0:
+                return False
+    return depth == 0
+
+
+def _append_text(segments: List[Segment], text: str) -> None:
+    if text:
+        segments.append({'type': 'text', 'value': text.replace(ESCAPED_DOLLAR, '$')})
+
+
+def segment_text(text: str) -> Tuple[List[Segment], List[str]]:
+    """Split a cleaned field into text and math segments.
+
+    Delimiters are found exactly as the math wrapper sees them: a $ after
+    \\\\ is a currency sign, not a delimiter. Also returns what is wrong with
+    the math: an unclosed $ (the rest of the field is kept as text), empty
+    math, or unbalanced braces.
+    """
+    delimiters = math_delimiters(text)
+    problems = []
+    if len(delimiters) % 2:
+        problems.append(f'unclosed $ at {delimiters[-1]}')
+        delimiters.pop()
+
+    segments: List[Segment] = []
+    pos = 0
+    for start, end in zip(delimiters[::2], delimiters[1::2]):
+        _append_text(segments, text[pos:start])
+        math = text[start + 1:end]
+        if not math.strip():
+            problems.append(f'empty math at {start}')
+        elif not _braces_balanced(math):
+            problems.append(f'unbalanced braces in math at {start}')
+        segments.append({'type': 'math', 'value': math})
+        pos = end + 1
+    _append_text(segments, text[pos:])
+    return segments, problems
+
+
+def add_segments(question: AnyQuestion, problems: List[Tuple[Any, str, str]],
+                 fields: List[str] = TEXT_FIELDS) -> AnyQuestion:
+    """Store <field>_segments next to every non-empty text field, in place.
+
+    Math problems are appended to `problems` as (order_num, field, problem).
+    """
+    for field in fields:
+        text = question.get(field)
+        if isinstance(text, str) and text:
+            segments, field_problems = segment_text(text)
+            question[field + SEGMENTS_SUFFIX] = segments
+            for problem in field_problems:
+                problems.append((question.get('order_num'), field, problem))
+    return question
+
+
+def report_problems(path: str, problems: List[Tuple[Any, str, str]], limit: int = 20) -> None:
+    if not problems:
+        print(f"✓ All math segments in {path} are balanced")
+        return
+    print(f"⚠ {len(problems)} math problem(s) in {path}:")
+    for order_num, field, problem in problems[:limit]:
+        print(f"  Question {order_num} {field}: {problem}")
+    if len(problems) > limit:
+        print(f"  ... and {len(problems) - limit} more")
+
+
+def add_segments_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--segments', action='store_true',
+                        help="also write <field>_segments, each text field split into text and "
+                             "math pieces for the frontend, and report unbalanced math")
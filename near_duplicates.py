@@ -0,0 +1,262 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import re
+import sqlite3
+import zlib
+from array import array
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from batch import DATA_DIR, input_files
+from question_io import AnyQuestion, iter_questions
+from shards import exam_name
+
+# Signature shape. 16 bands of 8 rows make pairs with Jaccard similarity
+# around 0.7 and up collide in some band; candidates are then kept when
+# their signatures agree on at least THRESHOLD of the positions.
+NUM_PERM = 128
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+# Words per shingle
+SHINGLE_SIZE = 3
+THRESHOLD = 0.8
+SEED = 1800
+
+# Fields compared, joined in this order
+DEDUP_FIELDS = ('question_text', 'option_a', 'option_b', 'option_c')
+
+# Stored signatures are only reused with the same parameters
+SIGNATURE_VERSION = f'minhash1-{NUM_PERM}-{SHINGLE_SIZE}-{SEED}'
+
+# Default signature store, kept next to the outputs
+SIGNATURES_NAME = '.signatures.sqlite'
+
+_MASK64 = (1 << 64) - 1
+_rng = random.Random(SEED)
+# Multiply-shift hash functions standing in for the permutations
+_PERMUTATIONS = [(_rng.getrandbits(64) | 1, _rng.getrandbits(64)) for _ in range(NUM_PERM)]
+
+# Runs of letters and digits; the LaTeX markup and punctuation the cleaner
+# moves around do not count
+TOKEN = re.compile(r'[a-z0-9]+(?:\.[0-9]+)?')
+LATEX_COMMAND = re.compile(r'\\+[a-z]+')
+
+Ident = Tuple[str, Any]
+Signature = Tuple[int, ...]
+
+
+def normalize(question: AnyQuestion) -> List[str]:
+    """Lowercase word tokens of the compared fields."""
+    parts = [question.get(field) for field in DEDUP_FIELDS]
+    text = ' '.join(part for part in parts if isinstance(part, str)).lower()
+    return TOKEN.findall(LATEX_COMMAND.sub(' ', text))
+
+
+def shingles(tokens: Sequence[str], size: int = SHINGLE_SIZE) -> List[int]:
+    """32-bit hashes of the distinct `size`-word shingles."""
+    if len(tokens) <= size:
+        grams = [' '.join(tokens)]
+    else:
+        grams = [' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)]
+    return list({zlib.crc32(gram.encode('utf-8')) for gram in grams})
+
+
+def minhash(hashes: Sequence[int]) -> Signature:
+    if not hashes:
+        return (0,) * NUM_PERM
+    return tuple(min(((a * x + b) & _MASK64) >> 32 for x in hashes) for a, b in _PERMUTATIONS)
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    """Estimated Jaccard similarity: the share of agreeing positions."""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def text_key(tokens: Sequence[str]) -> str:
+    return hashlib.sha256(f'{SIGNATURE_VERSION}\0{" ".join(tokens)}'.encode('utf-8')).hexdigest()
+
+
+class SignatureStore:
+    """MinHash signatures by normalized text, kept in SQLite across runs so
+    only new or edited questions are hashed again. path=None keeps them in
+    memory only."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.hashed = 0
+        self.reused = 0
+        self._db = sqlite3.connect(path or ':memory:', timeout=60)
+        self._db.execute('CREATE TABLE IF NOT EXISTS signatures ('
+                         ' key TEXT PRIMARY KEY,'
+                         ' signature BLOB NOT NULL)')
+        self._db.commit()
+
+    def signatures(self, token_lists: Sequence[List[str]]) -> List[Signature]:
+        keys = [text_key(tokens) for tokens in token_lists]
+        known: Dict[str, Signature] = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self._db.execute(
+                f"SELECT key, signature FROM signatures WHERE key IN ({', '.join('?' * len(chunk))})",
+                chunk)
+            for key, blob in rows:
+                known[key] = tuple(array('I', blob))
+
+        new = {}
+        result = []
+        for key, tokens in zip(keys, token_lists):
+            signature = known.get(key) or new.get(key)
+            if signature is None:
+                signature = new[key] = minhash(shingles(tokens))
+            result.append(signature)
+        self.hashed += len(new)
+        self.reused += len(keys) - len(new)
+        with self._db:
+            self._db.executemany('INSERT OR REPLACE INTO signatures (key, signature) VALUES (?, ?)',
+                                 [(key, array('I', sig).tobytes()) for key, sig in new.items()])
+        return result
+
+    def close(self) -> None:
+        self._db.close()
+
+
+def candidate_pairs(signatures: Sequence[Signature]) -> Iterable[Tuple[int, int]]:
+    """Pairs of positions whose signatures agree on every row of some band."""
+    seen = set()
+    for band in range(BANDS):
+        buckets: Dict[Signature, List[int]] = defaultdict(list)
+        start = band * ROWS
+        for position, signature in enumerate(signatures):
+            buckets[signature[start:start + ROWS]].append(position)
+        for members in buckets.values():
+            for i, first in enumerate(members):
+                for second in members[i + 1:]:
+                    if (first, second) not in seen:
+                        seen.add((first, second))
+                        yield first, second
+
+
+def cluster(signatures: Sequence[Signature], threshold: float = THRESHOLD) -> List[List[int]]:
+    """Groups of positions linked by candidate pairs at or above `threshold`,
+    each sorted, in order of their first member."""
+    parent = list(range(len(signatures)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for first, second in candidate_pairs(signatures):
+        if similarity(signatures[first], signatures[second]) >= threshold:
+            parent[find(second)] = find(first)
+
+    groups: Dict[int, List[int]] = defaultdict(list)
+    for position in range(len(signatures)):
+        groups[find(position)].append(position)
+    return sorted((members for members in groups.values() if len(members) > 1),
+                  key=lambda members: members[0])
+
+
+def find_near_duplicates(files: Sequence[str], store: Optional[SignatureStore] = None,
+                         threshold: float = THRESHOLD) -> List[List[Dict[str, Any]]]:
+    """Clusters of near-duplicate questions across `files`.
+
+    Each cluster lists its questions as {file, order_num, similarity}, the
+    similarity being to the first question of the cluster.
+    """
+    idents: List[Ident] = []
+    token_lists: List[List[str]] = []
+    for path in files:
+        for question in iter_questions(path):
+            tokens = normalize(question)
+            if tokens:
+                idents.append((path, question.get('order_num')))
+                token_lists.append(tokens)
+
+    owned = store is None
+    store = SignatureStore() if owned else store
+    try:
+        signatures = store.signatures(token_lists)
+    finally:
+        if owned:
+            store.close()
+
+    clusters = []
+    for members in cluster(signatures, threshold):
+        first = signatures[members[0]]
+        clusters.append([{'file': idents[i][0], 'order_num': idents[i][1],
+                          'similarity': round(similarity(first, signatures[i]), 3)}
+                         for i in members])
+    return clusters
+
+
+def report_near_duplicates(files: Sequence[str], signatures_path: Optional[str] = None,
+                           threshold: float = THRESHOLD) -> List[List[Dict[str, Any]]]:
+    """find_near_duplicates() with a persistent store, printing the clusters."""
+    store = SignatureStore(signatures_path)
+    try:
+        clusters = find_near_duplicates(files, store, threshold)
+    finally:
+        store.close()
+    print(f"Near-duplicate check: {store.hashed} question(s) hashed, {store.reused} reused")
+    if not clusters:
+        print(f"✓ No near-duplicate questions in {len(files)} file(s)")
+        return clusters
+    print(f"⚠ {len(clusters)} cluster(s) of near-duplicate questions:")
+    for members in clusters:
+        print('  ' + ' ~ '.join(f"{os.path.basename(m['file'])} #{m['order_num']}"
+                                + (f" ({m['similarity']:.2f})" if i else '')
+                                for i, m in enumerate(members)))
+    return clusters
+
+
+def is_output_bank(path: str) -> bool:
+    """Directory and glob inputs only pick up cleaned or fixed banks."""
+    return os.path.splitext(path)[0].endswith(('_cleaned', '_fixed'))
+
+
+def one_stage_per_exam(files: Sequence[str]) -> List[str]:
+    """Keep one bank per exam and directory, the _fixed one where both the
+    cleaned and fixed banks are given, since they hold the same questions."""
+    chosen: Dict[Tuple[str, str], str] = {}
+    for path in files:
+        key = (os.path.dirname(os.path.abspath(path)), exam_name(path))
+        if key not in chosen or os.path.splitext(path)[0].endswith('_fixed'):
+            chosen[key] = path
+    kept = set(chosen.values())
+    return [path for path in files if path in kept]
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Find near-duplicate questions across question banks with MinHash "
+                    "signatures and LSH banding.")
+    parser.add_argument('inputs', nargs='*', default=[DATA_DIR],
+                        help="*_cleaned/*_fixed files, directories or glob patterns (default: data/)")
+    parser.add_argument('--signatures', metavar='PATH',
+                        help=f"SQLite store of signatures reused across runs "
+                             f"(default: {SIGNATURES_NAME} next to the first input)")
+    parser.add_argument('--no-store', action='store_true',
+                        help="hash every question and keep nothing")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help="minimum estimated Jaccard similarity (default: %(default)s)")
+    parser.add_argument('-o', '--output', help="also write the clusters to this JSON file")
+    args = parser.parse_args(argv)
+
+    files = one_stage_per_exam(input_files(parser, args.inputs, include=is_output_bank))
+    if not files:
+        parser.error("no question banks found")
+    signatures = None if args.no_store else (
+        args.signatures or os.path.join(os.path.dirname(os.path.abspath(files[0])), SIGNATURES_NAME))
+    clusters = report_near_duplicates(files, signatures, args.threshold)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(clusters, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
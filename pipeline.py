@@ -0,0 +1,230 @@
+import argparse
+import hashlib
+import os
+from typing import Any, Callable, List, NamedTuple, Optional
+
+from batch import (
+    DATA_DIR, add_output_arguments, build_all, check_output_arguments, input_files, output_path,
+    output_version,
+)
+from clean_cfa_data import (
+    CLEANING_ENGINE, clean_cached_field, clean_questions, close_field_cache, is_raw_bank,
+    open_field_cache,
+)
+from differential import verify_output
+from field_cache import add_cache_arguments
+from fix_dollar_signs import fix_dollar_signs, rules_version
+from math_segments import add_segments, add_segments_argument, report_problems
+from question_io import TEXT_FIELDS, AnyQuestion, QuestionWriter, iter_questions
+from near_duplicates import SIGNATURES_NAME, report_near_duplicates
+from question_patch import add_patch_arguments, with_patch
+from shards import shard_path, with_index
+from rule_engine import (
+    add_guard_arguments, add_profile_arguments, disable_guard, disable_profiling, enable_guard,
+    enable_profiling, guard_settings, guarded,
+)
+from uploader import upload_file
+
+# Build manifest kept in each output directory
+PIPELINE_MANIFEST = '.pipeline_manifest.json'
+
+
+class PipelineStage(NamedTuple):
+    name: str
+    func: Callable[[str], str]
+    version: str
+
+
+class Pipeline:
+    """Field-level text transforms run back to back on every question.
+
+    Each text field goes through all registered stages while it is in
+    memory, so a question bank is read once and written once however many
+    stages there are.
+    """
+
+    def __init__(self, fields: List[str] = TEXT_FIELDS):
+        self.fields = fields
+        self.stages: List[PipelineStage] = []
+
+    def register(self, name: str, func: Callable[[str], str], version: str) -> None:
+        """Append a stage. `version` must change whenever the stage's output can."""
+        self.stages.append(PipelineStage(name, func, version))
+
+    @property
+    def version(self) -> str:
+        digest = hashlib.sha256()
+        for stage in self.stages:
+            digest.update(f'{stage.name}={stage.version}\0'.encode('utf-8'))
+        return digest.hexdigest()[:16]
+
+    def _run_stages(self, text: str) -> str:
+        for stage in self.stages:
+            text = stage.func(text)
+        return text
+
+    def _stage_values(self, text: str) -> List[str]:
+        values = []
+        for stage in self.stages:
+            text = stage.func(text)
+            values.append(text)
+        return values
+
+    def process(self, question: AnyQuestion) -> AnyQuestion:
+        """Run every stage over the question's text fields.
+
+        Under enable_guard(), a field over budget in any stage keeps its
+        raw text and is quarantined.
+        """
+        result = question.copy()
+        for field in self.fields:
+            value = result.get(field)
+            if isinstance(value, str) and value:
+                result[field] = guarded(self._run_stages, value, question.get('order_num'), field)
+        return result
+
+    def process_with_stages(self, question: AnyQuestion) -> List[AnyQuestion]:
+        """Like process(), but return the question as it was after each stage."""
+        snapshots = [question.copy() for _ in self.stages]
+        for field in self.fields:
+            value = question.get(field)
+            if isinstance(value, str) and value:
+                values = guarded(self._stage_values, value, question.get('order_num'), field,
+                                 kept=[value] * len(self.stages))
+                for snapshot, stage_value in zip(snapshots, values):
+                    snapshot[field] = stage_value
+        return snapshots
+
+    def run(self, input_file: str, output_file: str, workers: int = 1,
+            dump_dir: Optional[str] = None, compact: bool = False,
+            segments: bool = False) -> None:
+        """Read, transform and write a question bank one question at a time.
+
+        With dump_dir, the output of every stage is also written to
+        <dump_dir>/<name>_<stage><ext> for debugging. compact=True writes
+        one unindented question per line. segments=True adds the
+        <field>_segments split of every text field to the output (see
+        math_segments.py) and reports unbalanced math.
+        """
+        print(f"Reading {input_file}...")
+
+        questions = iter_questions(input_file, records=True)
+        dumps = []
+        if dump_dir:
+            os.makedirs(dump_dir, exist_ok=True)
+            stem, ext = os.path.splitext(os.path.basename(input_file))
+            dumps = [QuestionWriter(os.path.join(dump_dir, f'{stem}_{stage.name}{ext}'), compact)
+                     for stage in self.stages]
+            results = clean_questions(questions, workers, process=self.process_with_stages)
+        else:
+            results = clean_questions(questions, workers, process=self.process)
+
+        problems: List[Any] = []
+        try:
+            with QuestionWriter(output_file, compact) as writer:
+                for i, result in enumerate(results, 1):
+                    if i % 10 == 0:
+                        print(f"  Processed {i} questions...")
+                    if dumps:
+                        for dump, snapshot in zip(dumps, result):
+                            dump.write(snapshot)
+                        result = result[-1]
+                    if segments:
+                        add_segments(result, problems, self.fields)
+                    writer.write(result)
+        finally:
+            for dump in dumps:
+                dump.close()
+
+        print(f"✓ Done! {writer.count} questions saved to {output_file}")
+        if segments:
+            report_problems(output_file, problems)
+
+
+# The standard build: clean_cfa_data followed by fix_dollar_signs
+PIPELINE = Pipeline()
+PIPELINE.register('cleaned', clean_cached_field, CLEANING_ENGINE.version)
+PIPELINE.register('fixed', fix_dollar_signs, rules_version())
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Clean and fix CFA exam JSON data in a single pass "
+                    "(clean_cfa_data followed by fix_dollar_signs). Only files whose "
+                    "input or rules changed since the last run are rebuilt.")
+    parser.add_argument('inputs', nargs='*', default=[DATA_DIR],
+                        help="input files, directories or glob patterns (default: data/)")
+    add_output_arguments(parser, '_fixed', shard_dir=True)
+    add_patch_arguments(parser)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="number of processes (default: 1, in-process)")
+    add_cache_arguments(parser)
+    parser.add_argument('--dump-stages', metavar='DIR',
+                        help="also write each stage's output to DIR for debugging")
+    add_segments_argument(parser)
+    add_guard_arguments(parser)
+    add_profile_arguments(parser, cached=True)
+    parser.add_argument('--verify-sample', type=float, metavar='FRACTION',
+                        help="after each rebuild recompute this fraction of the fields with the "
+                             "frozen reference cleaner (see differential.py) and report differences")
+    parser.add_argument('--near-duplicates', action='store_true',
+                        help="afterwards report clusters of near-duplicate questions across all "
+                             f"outputs (signatures are kept in {SIGNATURES_NAME} next to them)")
+    parser.add_argument('--upload', metavar='EXAM_ID',
+                        help="afterwards upsert the output into the questions table of this exam "
+                             "(single input only, see uploader.py)")
+    parser.add_argument('--upload-target',
+                        help="sqlite:///path.db or a PostgREST URL (default: SUPABASE_URL)")
+    args = parser.parse_args(argv)
+
+    budget = guard_settings(parser, args)
+
+    inputs = input_files(parser, args.inputs, include=is_raw_bank)
+    if args.upload and len(inputs) != 1:
+        parser.error("--upload needs exactly one input file")
+    check_output_arguments(parser, args, inputs)
+    if args.output:
+        jobs = [(inputs[0], args.output)]
+    elif args.shard_dir:
+        jobs = [(path, shard_path(path, args.shard_dir)) for path in inputs]
+    else:
+        jobs = [(path, output_path(path, '_fixed', args.output_dir)) for path in inputs]
+
+    def build(input_file: str, output_file: str):
+        PIPELINE.run(input_file, output_file, args.workers, args.dump_stages, args.compact,
+                     args.segments)
+        if guard is not None:
+            guard.write_report(output_file)
+        if args.verify_sample:
+            verify_output(input_file, output_file, ('clean', 'fix'), args.verify_sample)
+
+    if args.patch or args.patch_dir:
+        build = with_patch(build, args.patch_dir)
+    if args.shard_dir:
+        build = with_index(build, args.shard_dir)
+
+    if args.cache:
+        open_field_cache(args.cache, args.cache_size_mb * 1024 * 1024)
+    if args.profile_rules:
+        enable_profiling()
+    guard = enable_guard(*budget) if budget is not None else None
+    try:
+        # Stage dumps only exist for files that get rebuilt
+        build_all(jobs, build, output_version(PIPELINE.version, args), PIPELINE_MANIFEST,
+                  force=args.force or bool(args.dump_stages))
+    finally:
+        close_field_cache()
+        disable_guard()
+        profiler = disable_profiling()
+    if profiler is not None:
+        print(profiler.report(args.profile_sort))
+    if args.near_duplicates and jobs:
+        outputs = [output for _, output in jobs]
+        report_near_duplicates(outputs, os.path.join(
+            os.path.dirname(os.path.abspath(outputs[0])), SIGNATURES_NAME))
+    if args.upload:
+        upload_file(jobs[0][1], args.upload, args.upload_target)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+import json
+import re
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple, Union
+
+try:
+    # Optional fast JSON backend, used for reading and for compact output
+    import orjson
+except ImportError:
+    orjson = None
+
+# Free-text fields of a question that the cleaning tools rewrite
+TEXT_FIELDS = [
+    'question_text',
+    'option_a',
+    'option_b',
+    'option_c',
+    'explanation_a',
+    'explanation_b',
+    'explanation_c',
+]
+
+# Fields of a question in the order the question banks store them
+QUESTION_FIELDS = (
+    'order_num',
+    'question_text',
+    'option_a',
+    'option_b',
+    'option_c',
+    'correct_option',
+    'explanation_a',
+    'explanation_b',
+    'explanation_c',
+)
+
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\r\n'
+# What may follow an item of a JSON array
+ITEM_END = WHITESPACE + ',]'
+
+
+# Marks a schema field the question does not have
+_MISSING = object()
+
+
+class Question:
+    """A question record with the bank's fixed field set.
+
+    Schema fields live in slots, so a question costs a fraction of a dict.
+    Fields outside the schema go to `extra`, and a question whose keys are
+    not in QUESTION_FIELDS order remembers its own order, so to_dict()
+    gives back exactly the mapping it was built from. Records support the
+    dict operations the cleaning tools use (get, [], in, copy, items), so
+    they can be passed wherever a question dict is expected.
+    """
+
+    __slots__ = QUESTION_FIELDS + ('extra', 'keys_order')
+
+    def __init__(self, data: Dict[str, Any]):
+        for field in QUESTION_FIELDS:
+            setattr(self, field, data.get(field, _MISSING))
+        extra = {key: value for key, value in data.items() if key not in QUESTION_FIELDS}
+        self.extra: Optional[Dict[str, Any]] = extra or None
+        keys = tuple(data)
+        # None when the keys are exactly QUESTION_FIELDS, in order
+        self.keys_order: Optional[Tuple[str, ...]] = None if keys == QUESTION_FIELDS else keys
+
+    def keys(self) -> Tuple[str, ...]:
+        if self.keys_order is not None:
+            return self.keys_order
+        return QUESTION_FIELDS
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in QUESTION_FIELDS:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key not in self:
+            self.keys_order = self.keys() + (key,)
+        if key in QUESTION_FIELDS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        for key in self.keys():
+            yield key, self[key]
+
+    def copy(self) -> 'Question':
+        question = Question.__new__(Question)
+        for field in self.__slots__:
+            setattr(question, field, getattr(self, field))
+        if self.extra is not None:
+            question.extra = dict(self.extra)
+        return question
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def __reduce__(self):
+        # Rebuilt from its mapping: _MISSING is a different object in the
+        # process that unpickles it
+        return Question, (self.to_dict(),)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, Question):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self) -> str:
+        return f'Question({self.to_dict()!r})'
+
+
+AnyQuestion = Union[Question, Dict[str, Any]]
+
+
+# orjson silently reads integers beyond 64 bits as floats. Every such
+# number has a run of at least 19 digits; text with one is left to json.
+_LONG_DIGITS = re.compile(r'[0-9]{19}')
+_LONG_DIGITS_BYTES = re.compile(rb'[0-9]{19}')
+
+
+def _loads(text: Union[str, bytes]) -> Any:
+    if orjson is not None:
+        long_digits = _LONG_DIGITS_BYTES if isinstance(text, bytes) else _LONG_DIGITS
+        if not long_digits.search(text):
+            try:
+                return orjson.loads(text)
+            except orjson.JSONDecodeError:
+                # Beyond orjson (NaN, Infinity, numbers too large for a
+                # double); let json decide
+                pass
+    return json.loads(text)
+
+
+def _dumps_compact(question: Dict[str, Any]) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(question).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(question, ensure_ascii=False, separators=(',', ':'))
+
+
+def is_jsonl(path: str) -> bool:
+    """JSON Lines files are recognised by extension."""
+    return path.endswith(('.jsonl', '.ndjson'))
+
+
+def _iter_json_array(f: TextIO) -> Iterator[Dict[str, Any]]:
+    """Yield the items of a top-level JSON array without loading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def skip(chars: str) -> None:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos] in chars:
+                pos += 1
+            if pos < len(buffer) or not fill():
+                return
+
+    skip(WHITESPACE)
+    if pos >= len(buffer) or buffer[pos] != '[':
+        raise ValueError(f"Expected a JSON array in {f.name}")
+    pos += 1
+
+    skip(WHITESPACE)
+    if pos < len(buffer) and buffer[pos] == ']':
+        return
+
+    while True:
+        skip(WHITESPACE)
+        while True:
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if not fill():
+                    raise
+                continue
+            # A number cut by the end of the buffer (12|34, 2.|5, -3e|-7)
+            # still decodes; only an item followed by its delimiter is whole
+            if end < len(buffer) and buffer[end] in ITEM_END or eof or not fill():
+                break
+        pos = end
+        yield item
+
+        skip(WHITESPACE)
+        if pos >= len(buffer):
+            raise ValueError(f"Unterminated JSON array in {f.name}")
+        if buffer[pos] == ']':
+            return
+        if buffer[pos] != ',':
+            raise ValueError(f"Expected ',' or ']' at item boundary in {f.name}")
+        pos += 1
+
+
+def iter_questions(path: str, records: bool = False) -> Iterator[AnyQuestion]:
+    """Read questions one at a time from a JSON array or JSON Lines file,
+    as Question records with records=True."""
+    with open(path, 'r', encoding='utf-8') as f:
+        if is_jsonl(path):
+            questions = (_loads(line) for line in f if line.strip())
+        else:
+            questions = _iter_json_array(f)
+        if records:
+            questions = map(Question, questions)
+        yield from questions
+
+
+def load_questions(path: str, records: bool = False) -> List[AnyQuestion]:
+    """Load a whole JSON array or JSON Lines file."""
+    if is_jsonl(path):
+        return list(iter_questions(path, records))
+    with open(path, 'rb' if orjson is not None else 'r') as f:
+        data = _loads(f.read()) if orjson is not None else json.load(f)
+    return [Question(question) for question in data] if records else data
+
+
+def dump_questions(data: List[AnyQuestion], path: str, compact: bool = False) -> None:
+    """Write questions as JSON Lines or as a JSON array, pretty-printed
+    unless `compact`."""
+    if is_jsonl(path) or compact or any(isinstance(q, Question) for q in data):
+        with QuestionWriter(path, compact) as writer:
+            for question in data:
+                writer.write(question)
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+class QuestionWriter:
+    """Write questions as they are produced.
+
+    `.jsonl` outputs get one compact question per line; anything else gets a
+    JSON array laid out exactly like `json.dump(data, f, indent=2)`. With
+    compact=True the array holds one question per line without indentation
+    or spaces, written by orjson when it is installed (JSON Lines too).
+    """
+
+    def __init__(self, path: str, compact: bool = False):
+        self.path = path
+        self.jsonl = is_jsonl(path)
+        self.compact = compact
+        self.count = 0
+        self._f = open(path, 'w', encoding='utf-8')
+
+    def write(self, question: AnyQuestion) -> None:
+        if isinstance(question, Question):
+            question = question.to_dict()
+        if self.compact:
+            if self.jsonl:
+                self._f.write(_dumps_compact(question))
+                self._f.write('\n')
+            else:
+                self._f.write(',\n' if self.count else '[\n')
+                self._f.write(_dumps_compact(question))
+        elif self.jsonl:
+            self._f.write(json.dumps(question, ensure_ascii=False))
+            self._f.write('\n')
+        else:
+            item = json.dumps(question, indent=2, ensure_ascii=False)
+            self._f.write(',\n  ' if self.count else '[\n  ')
+            self._f.write(item.replace('\n', '\n  '))
+        self.count += 1
+
+    def close(self) -> None:
+        if not self.jsonl:
+            self._f.write('\n]' if self.count else '[]')
+        self._f.close()
+
+    def __enter__(self) -> 'QuestionWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
@@ -0,0 +1,228 @@
+import argparse
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from batch import file_sha256
+from question_io import QuestionWriter, iter_questions
+
+# A patch is a JSON Lines file. The first line is a header:
+#   {"patch": 1, "key": "order_num", "base_sha256": "..."}
+# and every other line changes one field of one question:
+#   {"order_num": 12, "field": "option_a", "value": "..."}
+#   {"order_num": 12, "field": "option_a", "delete": true}
+#   {"order_num": 13, "delete": true}
+# base_sha256 is the hash of the file the patch applies to (null for a
+# patch that builds the whole file from nothing).
+PATCH_VERSION = 1
+
+
+def question_key(questions: List[Dict[str, Any]]) -> str:
+    """Questions are matched on `id` when they have one, else on `order_num`."""
+    return 'id' if questions and 'id' in questions[0] else 'order_num'
+
+
+def _index(questions: Iterable[Dict[str, Any]], key: str, path: str) -> Dict[Any, Dict[str, Any]]:
+    index: Dict[Any, Dict[str, Any]] = {}
+    for question in questions:
+        if question.get(key) in index:
+            raise ValueError(f"Duplicate {key} {question.get(key)!r} in {path}, cannot patch by {key}")
+        index[question.get(key)] = question
+    return index
+
+
+def diff_questions(old: Dict[Any, Dict[str, Any]], new: Iterable[Dict[str, Any]],
+                   key: str) -> Iterator[Dict[str, Any]]:
+    """Patch entries that turn the indexed `old` questions into `new`."""
+    seen = set()
+    for question in new:
+        ident = question.get(key)
+        if ident in seen:
+            raise ValueError(f"Duplicate {key} {ident!r}, cannot patch by {key}")
+        seen.add(ident)
+        previous = old.get(ident)
+        if previous is None:
+            # A new question: every field, the key included, in file order
+            for field, value in question.items():
+                yield {key: ident, 'field': field, 'value': value}
+            continue
+        for field, value in question.items():
+            if field not in previous or previous[field] != value:
+                yield {key: ident, 'field': field, 'value': value}
+        for field in previous:
+            if field not in question:
+                yield {key: ident, 'field': field, 'delete': True}
+    for ident in old:
+        if ident not in seen:
+            yield {key: ident, 'delete': True}
+
+
+def write_patch(old_file: Optional[str], new_file: str, patch_file: str) -> int:
+    """Write the patch from old_file (None: nothing) to new_file.
+
+    Returns the number of entries.
+    """
+    new = iter_questions(new_file)
+    first = next(new, None)
+    if old_file is None:
+        old_questions: List[Dict[str, Any]] = []
+    else:
+        old_questions = list(iter_questions(old_file))
+    key = question_key(old_questions or ([first] if first is not None else []))
+    old = _index(old_questions, key, old_file)
+
+    def questions():
+        if first is not None:
+            yield first
+            yield from new
+
+    count = 0
+    with open(patch_file, 'w', encoding='utf-8') as f:
+        header = {
+            'patch': PATCH_VERSION,
+            'key': key,
+            'base_sha256': file_sha256(old_file) if old_file else None,
+        }
+        f.write(json.dumps(header) + '\n')
+        for entry in diff_questions(old, questions(), key):
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            count += 1
+    return count
+
+
+def read_patch(patch_file: str) -> Iterator[Dict[str, Any]]:
+    with open(patch_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def apply_patch(base_file: Optional[str], patch_file: str, output_file: str,
+                check_base: bool = True) -> int:
+    """Apply patch_file to base_file and write the result to output_file.
+
+    Changed questions keep their place, new ones are appended in patch
+    order. The base file is checked against the hash recorded in the
+    patch unless check_base is False. Returns the number of questions
+    written.
+    """
+    entries = read_patch(patch_file)
+    header = next(entries, None)
+    if not header or header.get('patch') != PATCH_VERSION:
+        raise ValueError(f"{patch_file} is not a question patch")
+    key = header['key']
+
+    if check_base:
+        actual = file_sha256(base_file) if base_file and os.path.exists(base_file) else None
+        if actual != header['base_sha256']:
+            raise ValueError(f"{patch_file} was not made against {base_file} "
+                             f"(expected sha256 {header['base_sha256']}, got {actual})")
+
+    questions = _index(iter_questions(base_file), key, base_file) if base_file else {}
+    for entry in entries:
+        ident = entry[key]
+        if 'field' not in entry:
+            questions.pop(ident, None)
+            continue
+        question = questions.setdefault(ident, {})
+        if entry.get('delete'):
+            question.pop(entry['field'], None)
+        else:
+            question[entry['field']] = entry['value']
+
+    with QuestionWriter(output_file) as writer:
+        for question in questions.values():
+            writer.write(question)
+    return writer.count
+
+
+def patch_path(output_file: str, patch_dir: Optional[str] = None) -> str:
+    """mock1_cleaned.json -> mock1_cleaned.patch.jsonl, optionally in patch_dir."""
+    path = os.path.splitext(output_file)[0] + '.patch.jsonl'
+    if patch_dir:
+        path = os.path.join(patch_dir, os.path.basename(path))
+    return path
+
+
+def add_patch_arguments(parser: argparse.ArgumentParser) -> None:
+    """--patch and --patch-dir, for builds wrapped with with_patch()."""
+    parser.add_argument('--patch', action='store_true',
+                        help="on every rebuild also write <output>.patch.jsonl with the fields "
+                             "that changed since the previous output")
+    parser.add_argument('--patch-dir',
+                        help="write the --patch files here (implies --patch)")
+
+
+def with_patch(build: Callable[[str, str], None],
+               patch_dir: Optional[str] = None) -> Callable[[str, str], None]:
+    """Wrap a build(input, output) so that every rebuild also writes the
+    patch from the previous output file to the new one (see patch_path())."""
+
+    def patched_build(input_file: str, output_file: str) -> None:
+        previous = output_file + '.previous'
+        had_previous = os.path.exists(output_file)
+        if had_previous:
+            os.replace(output_file, previous)
+        try:
+            build(input_file, output_file)
+        except BaseException:
+            if had_previous:
+                os.replace(previous, output_file)
+            raise
+        patch_file = patch_path(output_file, patch_dir)
+        if patch_dir:
+            os.makedirs(patch_dir, exist_ok=True)
+        try:
+            count = write_patch(previous if had_previous else None, output_file, patch_file)
+        except ValueError as e:
+            # The output itself is fine, only this file cannot be patched
+            print(f"⚠ No patch for {output_file}: {e}")
+            return
+        finally:
+            if had_previous:
+                os.remove(previous)
+        print(f"✓ {count} changed field(s) written to {patch_file}")
+
+    return patched_build
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Diff two question bank files into a patch of changed fields, "
+                    "or apply such a patch to a local file.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    diff = commands.add_parser('diff', help="write the patch from OLD to NEW")
+    diff.add_argument('old')
+    diff.add_argument('new')
+    diff.add_argument('-o', '--output', help="patch file (default: <new>.patch.jsonl)")
+
+    apply = commands.add_parser('apply', help="apply PATCH to BASE")
+    apply.add_argument('patch')
+    apply.add_argument('base', nargs='?', help="file the patch was made against (omit for a full patch)")
+    apply.add_argument('-o', '--output', help="result file (default: overwrite BASE)")
+    apply.add_argument('--force', action='store_true',
+                       help="apply even if BASE is not the file the patch was made against")
+    args = parser.parse_args(argv)
+
+    if args.command == 'diff':
+        patch_file = args.output or patch_path(args.new)
+        count = write_patch(args.old, args.new, patch_file)
+        print(f"✓ {count} changed field(s) written to {patch_file}")
+        return
+
+    output_file = args.output or args.base
+    if not output_file:
+        parser.error("apply needs BASE or --output")
+    if output_file == args.base:
+        # Write next to the base and swap, the base is read while writing
+        temp_file = output_file + '.patching'
+        count = apply_patch(args.base, args.patch, temp_file, check_base=not args.force)
+        os.replace(temp_file, output_file)
+    else:
+        count = apply_patch(args.base, args.patch, output_file, check_base=not args.force)
+    print(f"✓ {count} questions written to {output_file}")
+
+
+if __name__ == "__main__":
+    main()
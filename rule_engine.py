@@ -0,0 +1,855 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import signal
+import threading
+import time
+import types
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, Union
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants
+    import sre_parse
+
+try:
+    import re2  # google-re2, a linear-time engine; see RuleGuard
+except ImportError:
+    re2 = None
+
+Replacement = Union[str, Callable[[re.Match], str]]
+
+# Separator between fields in RuleEngine.clean_batch(). NUL never occurs in
+# the question banks and no batch-safe pattern can match it.
+SENTINEL = '\0'
+
+# Global values whose contents are part of a function's behaviour
+_DATA_TYPES = (str, bytes, int, float, bool, tuple, list, dict, set, frozenset, re.Pattern)
+
+
+def _code_fingerprint(code: types.CodeType) -> str:
+    consts = [_code_fingerprint(c) if isinstance(c, types.CodeType) else repr(c)
+              for c in code.co_consts]
+    return f'{code.co_code.hex()}|{consts}|{code.co_names}'
+
+
+def _referenced_names(code: types.CodeType) -> List[str]:
+    names = list(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names += _referenced_names(const)
+    return names
+
+
+# Character classes that never match SENTINEL
+_SAFE_CATEGORIES = {sre_constants.CATEGORY_DIGIT, sre_constants.CATEGORY_SPACE,
+                    sre_constants.CATEGORY_WORD}
+# Word boundaries see SENTINEL exactly like the start or end of a field
+_SAFE_ASSERTIONS = {sre_constants.AT_BOUNDARY, sre_constants.AT_NON_BOUNDARY}
+
+
+def _can_cross_fields(items) -> bool:
+    """Could this parsed pattern match SENTINEL or depend on the text edges?"""
+    c = sre_constants
+    for op, av in items:
+        if op is c.LITERAL:
+            if av == ord(SENTINEL):
+                return True
+        elif op is c.IN:
+            for item_op, item_av in av:
+                if item_op is c.NEGATE:
+                    return True
+                if item_op is c.CATEGORY and item_av not in _SAFE_CATEGORIES:
+                    return True
+                if item_op is c.LITERAL and item_av == ord(SENTINEL):
+                    return True
+                if item_op is c.RANGE and item_av[0] <= ord(SENTINEL):
+                    return True
+        elif op is c.AT:
+            if av not in _SAFE_ASSERTIONS:
+                return True
+        elif op is c.SUBPATTERN:
+            if _can_cross_fields(av[-1]):
+                return True
+        elif op in (c.MAX_REPEAT, c.MIN_REPEAT):
+            if _can_cross_fields(av[2]):
+                return True
+        elif op is c.BRANCH:
+            if any(_can_cross_fields(branch) for branch in av[1]):
+                return True
+        elif op in (c.ASSERT, c.ASSERT_NOT):
+            if _can_cross_fields(av[1]):
+                return True
+        elif op is not c.GROUPREF:
+            # ANY, NOT_LITERAL and anything unknown
+            return True
+    return False
+
+
+def is_batch_safe(regex: re.Pattern) -> bool:
+    """Does substituting over fields joined by SENTINEL give the same result
+    as substituting over each field on its own?
+
+    That holds when no match can include SENTINEL, no assertion can tell it
+    apart from a field edge (only \\b and \\B are allowed) and the pattern
+    cannot match the empty string. Callable replacements must only look at
+    the matched text.
+    """
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+    return parsed.getwidth()[0] > 0 and not _can_cross_fields(parsed)
+
+
+# Assertions RE2 evaluates like `re` does (on ASCII text, for \\b and \\B).
+# `$` is left out: `re` also matches it before a final newline.
+_PORTABLE_ASSERTIONS = {sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING,
+                        sre_constants.AT_BOUNDARY, sre_constants.AT_NON_BOUNDARY}
+
+
+def _is_portable(items) -> bool:
+    """Does this parsed pattern only use what RE2 supports with the same meaning?"""
+    c = sre_constants
+    for op, av in items:
+        if op is c.AT:
+            if av not in _PORTABLE_ASSERTIONS:
+                return False
+        elif op is c.SUBPATTERN:
+            if not _is_portable(av[-1]):
+                return False
+        elif op in (c.MAX_REPEAT, c.MIN_REPEAT):
+            if not _is_portable(av[2]):
+                return False
+        elif op is c.BRANCH:
+            if not all(_is_portable(branch) for branch in av[1]):
+                return False
+        elif op not in (c.LITERAL, c.NOT_LITERAL, c.IN, c.ANY):
+            # Backreferences, lookarounds, atomic groups, possessive repeats
+            return False
+    return True
+
+
+def linear_pattern(regex: re.Pattern):
+    """The RE2 equivalent of a compiled pattern, or None when RE2 is not
+    installed or could match differently.
+
+    The twin only agrees with `regex` on ASCII text without \\v and the
+    \\x1c-\\x1f separators (RE2's \\d, \\w, \\s and \\b are ASCII only and
+    its \\s is just [\\t\\n\\f\\r ]); see is_linear_text(). Patterns that
+    can match the empty string are refused since the two engines step over
+    empty matches differently.
+    """
+    if re2 is None or regex.flags & re.VERBOSE:
+        return None
+    parsed = sre_parse.parse(regex.pattern, regex.flags)
+    if parsed.getwidth()[0] == 0 or not _is_portable(parsed):
+        return None
+    inline = ''.join(letter for flag, letter in ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'),
+                                                   (re.DOTALL, 's')) if regex.flags & flag)
+    try:
+        return re2.compile(f'(?{inline})' + regex.pattern if inline else regex.pattern)
+    except re2.error:
+        return None
+
+
+# ASCII characters that are \s to re but not to RE2
+_RE_ONLY_SPACES = re.compile(r'[\v\x1c-\x1f]')
+
+
+def is_linear_text(text: str) -> bool:
+    return text.isascii() and not _RE_ONLY_SPACES.search(text)
+
+
+def _is_portable_template(template: str) -> bool:
+    """Does the RE2 wrapper expand this replacement template like `re`?
+
+    It decodes templates as unicode_escape, which garbles non-ASCII text and
+    reads escapes other than group references and \\\\ its own way.
+    """
+    return template.isascii() and all(
+        escape.isdigit() or escape in 'g\\' for escape in re.findall(r'\\(.)', template))
+
+
+def callable_fingerprint(func: Callable, seen: Set[int] = None) -> str:
+    """Describe what a Python function does: its bytecode, constants, closure
+    values and the module-level data and helper functions it references.
+
+    Editing any of these (a word list, a compiled pattern, a helper) changes
+    the fingerprint. Memory addresses and line numbers are not included, so
+    the fingerprint is stable across runs.
+    """
+    seen = set() if seen is None else seen
+    if id(func) in seen:
+        return '<recursive>'
+    seen.add(id(func))
+    code = getattr(func, '__code__', None)
+    if code is None:
+        return repr(func)
+    parts = [_code_fingerprint(code)]
+    for cell in func.__closure__ or ():
+        value = cell.cell_contents
+        parts.append(callable_fingerprint(value, seen)
+                     if isinstance(value, types.FunctionType) else repr(value))
+    module_globals = func.__globals__
+    for name in dict.fromkeys(_referenced_names(code)):
+        value = module_globals.get(name)
+        if isinstance(value, types.FunctionType):
+            parts.append(name + '=' + callable_fingerprint(value, seen))
+        elif isinstance(value, _DATA_TYPES):
+            parts.append(name + '=' + repr(value))
+    return '\n'.join(parts)
+
+
+class Rule:
+    """A single precompiled regex substitution."""
+
+    __slots__ = ('name', 'regex', 'repl', 'fixed_point', 'batch_safe')
+
+    def __init__(self, name: str, pattern: str, repl: Replacement,
+                 flags: int = 0, fixed_point: bool = False):
+        self.name = name
+        self.regex = re.compile(pattern, flags)
+        self.repl = repl
+        # Re-apply until the pattern no longer matches (the old `while re.search` loops)
+        self.fixed_point = fixed_point
+        self.batch_safe = is_batch_safe(self.regex) and not (
+            isinstance(repl, str) and SENTINEL in repl)
+
+    def fingerprint(self) -> str:
+        repl = self.repl if isinstance(self.repl, str) else callable_fingerprint(self.repl)
+        return f'{self.name}|{self.regex.pattern}|{self.regex.flags}|{self.fixed_point}|{repl}'
+
+    def apply(self, text: str) -> str:
+        if self.fixed_point:
+            while self.regex.search(text):
+                text = self.regex.sub(self.repl, text)
+            return text
+        return self.regex.sub(self.repl, text)
+
+    def apply_counted(self, text: str) -> Tuple[str, int]:
+        """apply(), also returning the number of substitutions made."""
+        if self.fixed_point:
+            total = 0
+            while self.regex.search(text):
+                text, count = self.regex.subn(self.repl, text)
+                total += count
+            return text, total
+        return self.regex.subn(self.repl, text)
+
+
+class FunctionRule:
+    """A cleaning step that is not a single regex (literal replaces, scanners)."""
+
+    __slots__ = ('name', 'func')
+
+    # The function may look at the whole field
+    batch_safe = False
+
+    def __init__(self, name: str, func: Callable[[str], str]):
+        self.name = name
+        self.func = func
+
+    def fingerprint(self) -> str:
+        return f'{self.name}|{callable_fingerprint(self.func)}'
+
+    def apply(self, text: str) -> str:
+        return self.func(text)
+
+    def apply_counted(self, text: str) -> Tuple[str, int]:
+        """apply(); the function is opaque, so it counts 1 if the text changed."""
+        result = self.func(text)
+        return result, int(result != text)
+
+
+class LiteralReplacer:
+    """Apply literal replacements exactly like consecutive `str.replace` calls.
+
+    Most fields contain none of the keys, so a single scan of a precompiled
+    alternation of every key comes first and such fields are returned after
+    it, instead of after one `str.replace` scan per entry. Fields with a
+    match are replaced entry by entry, in order, so entries that cascade
+    into each other (`'with in '` -> `'within '` followed by `'in correct'`)
+    keep their current precedence.
+    """
+
+    __slots__ = ('name', 'replacements', 'gate', 'batch_safe')
+
+    def __init__(self, name: str, replacements: Dict[str, str]):
+        self.name = name
+        self.replacements = list(replacements.items())
+        self.batch_safe = all(key and SENTINEL not in key + value
+                              for key, value in self.replacements)
+        # One key is searched for by str.replace itself just as fast
+        self.gate = (re.compile(alternation(replacements))
+                     if len(self.replacements) > 1 else None)
+
+    def fingerprint(self) -> str:
+        return f'{self.name}|{self.replacements!r}'
+
+    def apply(self, text: str) -> str:
+        if self.gate is not None and not self.gate.search(text):
+            return text
+        for key, value in self.replacements:
+            text = text.replace(key, value)
+        return text
+
+    def apply_counted(self, text: str) -> Tuple[str, int]:
+        """apply(), also returning the number of replacements made."""
+        total = 0
+        if self.gate is not None and not self.gate.search(text):
+            return text, total
+        for key, value in self.replacements:
+            count = text.count(key)
+            if count:
+                text = text.replace(key, value)
+                total += count
+        return text, total
+
+
+AnyRule = Union[Rule, FunctionRule, LiteralReplacer]
+
+
+class RuleProfiler:
+    """Per-rule wall time, call count and substitution count.
+
+    Stats are keyed by `stage/rule` and kept as [calls, subs, changed,
+    seconds] lists so worker processes can send them back to be merged.
+    `changed` counts the calls that actually modified the text.
+    """
+
+    SORT_KEYS = {
+        'time': lambda item: -item[1][3],
+        'calls': lambda item: -item[1][0],
+        'subs': lambda item: -item[1][1],
+        'changed': lambda item: -item[1][2],
+        'order': None,
+    }
+
+    def __init__(self):
+        self.stats: Dict[str, List] = {}
+
+    def run_stage(self, stage: 'Stage', text: str) -> str:
+        clock = time.perf_counter
+        for rule in stage.rules:
+            start = clock()
+            result, count = rule.apply_counted(text)
+            elapsed = clock() - start
+            key = stage.name + '/' + rule.name
+            entry = self.stats.get(key)
+            if entry is None:
+                entry = self.stats[key] = [0, 0, 0, 0.0]
+            entry[0] += 1
+            entry[1] += count
+            entry[2] += result != text
+            entry[3] += elapsed
+            text = result
+        return text
+
+    def merge(self, stats: Dict[str, List]) -> None:
+        for key, (calls, subs, changed, seconds) in stats.items():
+            entry = self.stats.setdefault(key, [0, 0, 0, 0.0])
+            entry[0] += calls
+            entry[1] += subs
+            entry[2] += changed
+            entry[3] += seconds
+
+    def take(self) -> Dict[str, List]:
+        """Return the stats collected so far and start over."""
+        stats, self.stats = self.stats, {}
+        return stats
+
+    def report(self, sort: str = 'time') -> str:
+        """A table of every rule that ran, sorted by `sort` (see SORT_KEYS).
+
+        Rules that never changed any text are marked as dead.
+        """
+        items = list(self.stats.items())
+        if self.SORT_KEYS[sort] is not None:
+            items.sort(key=self.SORT_KEYS[sort])
+        total = sum(entry[3] for _, entry in items) or 1.0
+        width = max([len(key) for key, _ in items] + [4])
+        lines = [f"{'rule':<{width}} {'calls':>9} {'subs':>9} {'changed':>9} "
+                 f"{'ms':>10} {'us/call':>9} {'share':>7}"]
+        for key, (calls, subs, changed, seconds) in items:
+            lines.append(f"{key:<{width}} {calls:>9} {subs:>9} {changed:>9} "
+                         f"{seconds * 1e3:>10.2f} {seconds / calls * 1e6:>9.2f} "
+                         f"{seconds / total:>7.1%}" + ('  dead' if not changed else ''))
+        return '\n'.join(lines)
+
+
+# Profiler consulted by Stage.apply(), see enable_profiling()
+_profiler: Optional[RuleProfiler] = None
+
+
+def enable_profiling() -> RuleProfiler:
+    """Start recording per-rule stats in this process and return the profiler."""
+    global _profiler
+    if _profiler is None:
+        _profiler = RuleProfiler()
+    return _profiler
+
+
+def disable_profiling() -> Optional[RuleProfiler]:
+    """Stop recording and return the profiler with everything it collected."""
+    global _profiler
+    profiler, _profiler = _profiler, None
+    return profiler
+
+
+def active_profiler() -> Optional[RuleProfiler]:
+    return _profiler
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser, cached: bool = False) -> None:
+    """--profile-rules and --profile-sort; `cached` for tools with --cache."""
+    parser.add_argument('--profile-rules', action='store_true',
+                        help="report time, calls and substitutions per rule at the end"
+                             + (" (fields served from --cache run no cleaning rules)"
+                                if cached else ""))
+    parser.add_argument('--profile-sort', choices=sorted(RuleProfiler.SORT_KEYS), default='time',
+                        help="order of the --profile-rules report (default: time)")
+
+
+class RuleBudgetExceeded(Exception):
+    """A rule ran past the time or step budget of a guarded field."""
+
+    def __init__(self, rule: str, reason: str):
+        super().__init__(f'{rule}: {reason}')
+        self.rule = rule
+        self.reason = reason
+
+
+# Report of the fields a guarded build kept uncleaned, next to its output
+QUARANTINE_SUFFIX = '.quarantine.jsonl'
+
+
+def load_quarantine(output_file: str) -> List[Dict[str, Any]]:
+    """The entries of the quarantine report of output_file, if it has one."""
+    path = output_file + QUARANTINE_SUFFIX
+    if not os.path.exists(path):
+        return []
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class RuleGuard:
+    """Runs rules so that one pathological field cannot stall a batch.
+
+    Each RuleEngine.clean() call gets `seconds` of wall time. On Unix, in
+    the main thread, a timer interrupts a regex that is still backtracking
+    when it runs out; elsewhere the budget is checked between rules.
+    Fixed-point rules may make at most `max_steps` passes. With `linear`,
+    rules whose pattern RE2 supports run on RE2 (see linear_pattern()) for
+    ASCII text, which cannot backtrack at all.
+
+    A field over budget raises RuleBudgetExceeded. The caller keeps its raw
+    text and hands the error to quarantine(), which collects a report.
+    """
+
+    def __init__(self, seconds: Optional[float] = 0.5, max_steps: int = 1000,
+                 linear: bool = False):
+        self.seconds = seconds
+        self.max_steps = max_steps
+        self.linear = linear and re2 is not None
+        self.quarantined: List[Dict[str, Any]] = []
+        self._twins: Dict[int, Any] = {}
+        # True while a field is being cleaned
+        self.running = False
+        self._deadline: Optional[float] = None
+        self._rule = ''
+        self._timer = False
+        self._previous_handler = None
+
+    def install(self) -> None:
+        """Use an interval timer for the time budget where possible."""
+        if (self.seconds and hasattr(signal, 'setitimer')
+                and threading.current_thread() is threading.main_thread()):
+            self._previous_handler = signal.signal(signal.SIGALRM, self._expire)
+            self._timer = True
+
+    def uninstall(self) -> None:
+        if self._timer:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self._previous_handler)
+            self._timer = False
+
+    def _expire(self, signum, frame) -> None:
+        if self.running:
+            raise RuleBudgetExceeded(self._rule, f'over the {self.seconds:g}s budget')
+
+    def run(self, func: Callable[[str], str], text: str) -> str:
+        """func(text) under the time budget of one field."""
+        if self.running:
+            return func(text)
+        self.running = True
+        if self.seconds:
+            self._deadline = time.perf_counter() + self.seconds
+            if self._timer:
+                signal.setitimer(signal.ITIMER_REAL, self.seconds)
+        try:
+            return func(text)
+        finally:
+            self.running = False
+            self._deadline = None
+            if self._timer:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+
+    def _engine(self, rule: 'Rule', text: str) -> Tuple[re.Pattern, Replacement]:
+        """The pattern and replacement to run `rule` with on `text`."""
+        if self.linear and is_linear_text(text):
+            key = id(rule)
+            if key not in self._twins:
+                twin = None
+                if callable(rule.repl) or _is_portable_template(rule.repl):
+                    twin = linear_pattern(rule.regex)
+                self._twins[key] = twin
+            if self._twins[key] is not None:
+                return self._twins[key], rule.repl
+        return rule.regex, rule.repl
+
+    def apply(self, rule: AnyRule, text: str) -> str:
+        if not isinstance(rule, Rule):
+            return rule.apply(text)
+        if not rule.fixed_point:
+            regex, repl = self._engine(rule, text)
+            return regex.sub(repl, text)
+        for _ in range(self.max_steps):
+            regex, repl = self._engine(rule, text)
+            if not regex.search(text):
+                return text
+            text = regex.sub(repl, text)
+        raise RuleBudgetExceeded(self._rule, f'still matching after {self.max_steps} passes')
+
+    def run_stage(self, stage: 'Stage', text: str) -> str:
+        for rule in stage.rules:
+            self._rule = stage.name + '/' + rule.name
+            text = self.apply(rule, text)
+            if self._deadline is not None and time.perf_counter() > self._deadline:
+                raise RuleBudgetExceeded(self._rule, f'over the {self.seconds:g}s budget')
+        return text
+
+    def quarantine(self, order_num: Any, field: str, error: RuleBudgetExceeded, text: str) -> None:
+        self.quarantined.append({'order_num': order_num, 'field': field, 'rule': error.rule,
+                                 'reason': error.reason, 'text': text})
+
+    def merge(self, quarantined: List[Dict[str, Any]]) -> None:
+        self.quarantined.extend(quarantined)
+
+    def take(self) -> List[Dict[str, Any]]:
+        """Return the fields quarantined so far and start over."""
+        quarantined, self.quarantined = self.quarantined, []
+        return quarantined
+
+    def settings(self) -> Tuple[Optional[float], int, bool]:
+        """Arguments for enable_guard() in a worker process."""
+        return self.seconds, self.max_steps, self.linear
+
+    def write_report(self, output_file: str) -> None:
+        """Write the fields quarantined while building output_file to
+        <output>.quarantine.jsonl and print a summary."""
+        quarantined = self.take()
+        path = output_file + QUARANTINE_SUFFIX
+        if not quarantined:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            for entry in quarantined:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        print(f"⚠ {len(quarantined)} field(s) over budget kept uncleaned, see {path}:")
+        for entry in quarantined[:10]:
+            print(f"  Question {entry['order_num']} {entry['field']}: "
+                  f"{entry['rule']} {entry['reason']}")
+
+
+# Guard consulted by RuleEngine.clean() and Stage.apply(), see enable_guard()
+_guard: Optional[RuleGuard] = None
+
+
+def enable_guard(seconds: Optional[float] = 0.5, max_steps: int = 1000,
+                 linear: bool = False) -> RuleGuard:
+    """Run every field under a RuleGuard in this process and return it."""
+    global _guard
+    if linear and re2 is None:
+        print("⚠ google-re2 is not installed, every rule runs on re")
+    if _guard is None:
+        _guard = RuleGuard(seconds, max_steps, linear)
+        _guard.install()
+    return _guard
+
+
+def disable_guard() -> Optional[RuleGuard]:
+    """Stop guarding and return the guard with the fields it quarantined."""
+    global _guard
+    guard, _guard = _guard, None
+    if guard is not None:
+        guard.uninstall()
+    return guard
+
+
+def active_guard() -> Optional[RuleGuard]:
+    return _guard
+
+
+def guarded(clean: Callable[[str], Any], text: str, order_num: Any, field: str,
+            kept: Any = None) -> Any:
+    """clean(text) for one field of a question.
+
+    Under enable_guard(), a field over budget is quarantined with the text
+    it came in with, and `kept` (that text by default) is returned instead.
+    """
+    try:
+        return clean(text)
+    except RuleBudgetExceeded as e:
+        _guard.quarantine(order_num, field, e, text)
+        return text if kept is None else kept
+
+
+def add_guard_arguments(parser: argparse.ArgumentParser) -> None:
+    """--field-budget, --max-passes and --linear, see guard_settings()."""
+    parser.add_argument('--field-budget', type=float, metavar='SECONDS',
+                        help="give every field this much time in each rule engine and fixed-point "
+                             "rules --max-passes passes; fields over budget keep the text they "
+                             "came in with and are listed in <output>.quarantine.jsonl")
+    parser.add_argument('--max-passes', type=int, default=1000,
+                        help="passes allowed to a fixed-point rule under --field-budget "
+                             "(default: %(default)s)")
+    parser.add_argument('--linear', action='store_true',
+                        help="with --field-budget, run the rules RE2 supports on RE2 (google-re2, "
+                             "when installed) for ASCII fields")
+
+
+def guard_settings(parser: argparse.ArgumentParser,
+                   args: argparse.Namespace) -> Optional[Tuple[float, int, bool]]:
+    """Arguments for enable_guard() from add_guard_arguments(), or None
+    without --field-budget."""
+    if args.field_budget is None:
+        if args.linear:
+            parser.error("--linear needs --field-budget")
+        return None
+    if getattr(args, 'profile_rules', False):
+        parser.error("--field-budget and --profile-rules cannot be combined")
+    return args.field_budget, args.max_passes, args.linear
+
+
+Trigger = Union[str, re.Pattern]
+
+
+class Stage:
+    """An ordered group of rules that together make up one pipeline step.
+
+    `triggers` lists what a text must contain for any rule of the stage to
+    match: literal substrings, or compiled patterns for character classes
+    and case-insensitive words. RuleEngine skips the stage for text that
+    contains none of them. It must cover every rule, since a wrong trigger
+    silently skips a rule. None (the default) always runs the stage.
+    """
+
+    def __init__(self, name: str, rules: Sequence[AnyRule],
+                 triggers: Optional[Sequence[Trigger]] = None):
+        self.name = name
+        self.rules = list(rules)
+        self.triggers = None if triggers is None else [
+            re.compile(re.escape(t)) if isinstance(t, str) else t for t in triggers]
+        # Can the triggers be looked up in a SENTINEL-joined batch?
+        self.batch_triggers = self.triggers is not None and all(map(is_batch_safe, self.triggers))
+
+    def fingerprint(self) -> str:
+        triggers = '' if self.triggers is None else repr(
+            [(t.pattern, t.flags) for t in self.triggers])
+        return self.name + '\n' + triggers + '\n' + '\n'.join(rule.fingerprint() for rule in self.rules)
+
+    def apply(self, text: str) -> str:
+        if not text:
+            return text
+        if _guard is not None:
+            return _guard.run_stage(self, text)
+        if _profiler is not None:
+            return _profiler.run_stage(self, text)
+        for rule in self.rules:
+            text = rule.apply(text)
+        return text
+
+
+class RuleEngine:
+    """Runs a fixed sequence of stages over a text field.
+
+    With `prefilter` on, each distinct stage trigger gets a bit in a feature
+    bitmap of the text. Bits are tested lazily, at most once per trigger
+    until a stage changes the text, and stages whose triggers are all absent
+    are skipped. Plain phrases such as most options then cost a handful of
+    searches instead of a hundred substitutions.
+    """
+
+    def __init__(self, stages: Sequence[Stage], prefilter: bool = True):
+        self.stages = list(stages)
+        self.prefilter = prefilter
+        self._version = None
+        # Distinct triggers across stages, as (bit, pattern)
+        bits: Dict[tuple, int] = {}
+        self._features: List[Tuple[int, re.Pattern]] = []
+        # (stage, mask of its trigger bits or 0 to always run)
+        self._plan: List[Tuple[Stage, int]] = []
+        for stage in self.stages:
+            mask = 0
+            for trigger in stage.triggers or ():
+                key = (trigger.pattern, trigger.flags)
+                if key not in bits:
+                    bits[key] = 1 << len(bits)
+                    self._features.append((bits[key], trigger))
+                mask |= bits[key]
+            self._plan.append((stage, mask))
+
+    @property
+    def version(self) -> str:
+        """Hash of the whole rule set; changes whenever any rule is edited."""
+        if self._version is None:
+            digest = hashlib.sha256()
+            for stage in self.stages:
+                digest.update(stage.fingerprint().encode('utf-8'))
+                digest.update(b'\0')
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+    def stage(self, name: str) -> Stage:
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(name)
+
+    def clean(self, text: str) -> str:
+        if _guard is not None and not _guard.running:
+            return _guard.run(self.clean, text)
+        if not self.prefilter:
+            for stage in self.stages:
+                text = stage.apply(text)
+            return text
+
+        # Bits tested so far and bits found, for the current text
+        known = present = 0
+        for stage, mask in self._plan:
+            if mask:
+                unknown = mask & ~known
+                if unknown:
+                    for bit, pattern in self._features:
+                        if bit & unknown and pattern.search(text):
+                            present |= bit
+                    known |= unknown
+                if not present & mask:
+                    continue
+            result = stage.apply(text)
+            if result is not text:
+                text = result
+                known = present = 0
+        return text
+
+    def clean_batch(self, texts: Sequence[str]) -> List[str]:
+        """clean() every text, running batch-safe rules once over all of them.
+
+        The texts are joined with SENTINEL while consecutive rules are batch
+        safe and split back for the others (scanners such as the math
+        wrapper, rules anchored to the field edges), so short fields stop
+        paying one Python-level call per rule each. Stages whose triggers
+        appear in no text are skipped for the whole batch.
+        """
+        if not texts:
+            return []
+        if (_profiler is not None or _guard is not None
+                or any(SENTINEL in text for text in texts)):
+            return [self.clean(text) for text in texts]
+
+        # Exactly one of the two is set: the joined buffer or the split fields
+        joined: Optional[str] = SENTINEL.join(texts)
+        fields: Optional[List[str]] = None
+        for stage in self.stages:
+            if stage.batch_triggers:
+                haystacks = [joined] if joined is not None else fields
+                if not any(pattern.search(text)
+                           for pattern in stage.triggers for text in haystacks):
+                    continue
+            # Per-field trigger check, made once per stage when first needed
+            active = None
+            for rule in stage.rules:
+                if rule.batch_safe:
+                    if joined is None:
+                        joined, fields = SENTINEL.join(fields), None
+                    joined = rule.apply(joined)
+                    continue
+                if fields is None:
+                    fields, joined = joined.split(SENTINEL), None
+                if active is None:
+                    active = [bool(text) and (stage.triggers is None or any(
+                        pattern.search(text) for pattern in stage.triggers))
+                        for text in fields]
+                fields = [rule.apply(text) if is_active else text
+                          for text, is_active in zip(fields, active)]
+        return fields if fields is not None else joined.split(SENTINEL)
+
+
+def prefix_free_groups(words: Iterable[str]) -> List[List[str]]:
+    """Split an ordered word list into consecutive groups where no word is a
+    prefix of another word in the same group.
+
+    Sequential `re.sub` calls over such a group can be merged into a single
+    alternation pass without changing the result.
+    """
+    groups: List[List[str]] = []
+    current: List[str] = []
+    for word in words:
+        if any(w.startswith(word) or word.startswith(w) for w in current):
+            groups.append(current)
+            current = []
+        current.append(word)
+    if current:
+        groups.append(current)
+    return groups
+
+
+def alternation(words: Iterable[str], capture: bool = False) -> str:
+    """Build a regex alternation group from literal words.
+
+    The words are factored into a prefix trie (`p(?:rofit|rice)` rather than
+    `profit|price`) so the regex engine can reject a position after one
+    character. Where one word is a prefix of another the longer one is tried
+    first, so only use this where the surrounding pattern decides which word
+    may match.
+    """
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[''] = {}
+
+    def emit(node: Dict[str, dict]) -> str:
+        branches = [re.escape(ch) + emit(child) for ch, child in node.items() if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            body = '(?:' + body + ')?'
+        return body
+
+    return ('(' if capture else '(?:') + emit(trie) + ')'
+
+
+def run_splitter(name: str, words: Sequence[str], flags: int = 0) -> Rule:
+    """Merge rules of the shape `(word)([a-z]{3,})` -> `\\1 \\2` into one pass.
+
+    Each of those rules only ever sees a maximal run of letters, so applying
+    them one after another over the whole text is the same as applying them
+    one after another to every letter run on its own. A single scan finds the
+    runs that contain any candidate word and only those runs get the
+    sequential treatment.
+    """
+    splitters = [re.compile('(' + re.escape(w) + ')([a-z]{3,})', flags) for w in words]
+
+    def split(match: re.Match) -> str:
+        run = match.group(0)
+        for regex in splitters:
+            run = regex.sub(r'\1 \2', run)
+        return run
+
+    pattern = r'(?<![a-z])[a-z]*?' + alternation(words) + r'[a-z]{3,}'
+    return Rule(name, pattern, split, flags)
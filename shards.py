@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from batch import file_sha256
+from question_io import _loads
+
+# A shard directory holds one JSON Lines shard per exam/session plus
+# index.json:
+#   {"version": 1,
+#    "exams": {"mock1_section2": {"shard": "mock1_section2.jsonl",
+#                                 "sha256": "...", "count": 90,
+#                                 "questions": {"1": [0, 812], ...}}}}
+# where each order_num maps to the [byte offset, byte length] of its line,
+# so one question can be read with a seek instead of parsing the shard.
+INDEX_VERSION = 1
+INDEX_NAME = 'index.json'
+SHARD_EXTENSION = '.jsonl'
+
+
+def exam_name(input_file: str, suffixes: Tuple[str, ...] = ('_cleaned', '_fixed')) -> str:
+    """mock1_section2_cleaned.json -> mock1_section2"""
+    stem = os.path.splitext(os.path.basename(input_file))[0]
+    for suffix in suffixes:
+        if stem.endswith(suffix):
+            return stem[:-len(suffix)]
+    return stem
+
+
+def shard_path(input_file: str, shard_dir: str) -> str:
+    return os.path.join(shard_dir, exam_name(input_file) + SHARD_EXTENSION)
+
+
+def index_shard(path: str) -> Iterator[Tuple[Any, int, int]]:
+    """(order_num, offset, length) of every question line in a shard."""
+    offset = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            length = len(line.rstrip(b'\r\n'))
+            if line.strip():
+                yield _loads(line).get('order_num'), offset, length
+            offset += len(line)
+
+
+def load_index(shard_dir: str) -> Dict[str, Any]:
+    path = os.path.join(shard_dir, INDEX_NAME)
+    if not os.path.exists(path):
+        return {'version': INDEX_VERSION, 'exams': {}}
+    with open(path, 'r', encoding='utf-8') as f:
+        index = json.load(f)
+    if index.get('version') != INDEX_VERSION:
+        raise ValueError(f"{path} is not a version {INDEX_VERSION} shard index")
+    return index
+
+
+def update_index(shard_dir: str, shard_file: str) -> Dict[str, Any]:
+    """Record shard_file in the index of shard_dir and drop shards that no
+    longer exist. Returns the new entry."""
+    questions: Dict[str, List[int]] = {}
+    for order_num, offset, length in index_shard(shard_file):
+        key = str(order_num)
+        if key in questions:
+            raise ValueError(f"Duplicate order_num {order_num!r} in {shard_file}, cannot index it")
+        questions[key] = [offset, length]
+
+    index = load_index(shard_dir)
+    name = os.path.splitext(os.path.basename(shard_file))[0]
+    entry = {
+        'shard': os.path.basename(shard_file),
+        'sha256': file_sha256(shard_file),
+        'count': len(questions),
+        'questions': questions,
+    }
+    index['exams'][name] = entry
+    index['exams'] = {
+        exam: value for exam, value in sorted(index['exams'].items())
+        if os.path.exists(os.path.join(shard_dir, value['shard']))
+    }
+
+    # Readers never see a half-written index
+    path = os.path.join(shard_dir, INDEX_NAME)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(path + '.tmp', path)
+    return entry
+
+
+def with_index(build: Callable[[str, str], None], shard_dir: str) -> Callable[[str, str], None]:
+    """Wrap a build(input, shard) so that every rebuilt shard is indexed."""
+
+    def indexed_build(input_file: str, output_file: str) -> None:
+        build(input_file, output_file)
+        entry = update_index(shard_dir, output_file)
+        print(f"✓ Indexed {entry['count']} questions of {output_file}")
+
+    return indexed_build
+
+
+class ShardReader:
+    """Read single questions or whole exams from a shard directory."""
+
+    def __init__(self, shard_dir: str):
+        self.shard_dir = shard_dir
+        self.index = load_index(shard_dir)
+
+    @property
+    def exams(self) -> List[str]:
+        return list(self.index['exams'])
+
+    def _entry(self, exam: str) -> Dict[str, Any]:
+        try:
+            return self.index['exams'][exam]
+        except KeyError:
+            raise KeyError(f"No exam {exam!r} in {self.shard_dir}") from None
+
+    def get(self, exam: str, order_num: Any) -> Dict[str, Any]:
+        """One question, read with a single seek."""
+        entry = self._entry(exam)
+        try:
+            offset, length = entry['questions'][str(order_num)]
+        except KeyError:
+            raise KeyError(f"No question {order_num!r} in exam {exam!r}") from None
+        with open(os.path.join(self.shard_dir, entry['shard']), 'rb') as f:
+            f.seek(offset)
+            return _loads(f.read(length))
+
+    def questions(self, exam: str) -> Iterator[Dict[str, Any]]:
+        """Every question of an exam, in shard order."""
+        with open(os.path.join(self.shard_dir, self._entry(exam)['shard']), 'rb') as f:
+            for line in f:
+                if line.strip():
+                    yield _loads(line)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Print questions from a shard directory written with --shard-dir, "
+                    "or list its exams.")
+    parser.add_argument('shard_dir')
+    parser.add_argument('exam', nargs='?', help="exam to print (default: list the exams)")
+    parser.add_argument('order_nums', nargs='*', help="only these questions")
+    args = parser.parse_args(argv)
+
+    reader = ShardReader(args.shard_dir)
+    if not args.exam:
+        for exam in reader.exams:
+            entry = reader.index['exams'][exam]
+            print(f"{exam}: {entry['count']} questions in {entry['shard']}")
+        return
+    if args.order_nums:
+        questions = [reader.get(args.exam, order_num) for order_num in args.order_nums]
+    else:
+        questions = list(reader.questions(args.exam))
+    print(json.dumps(questions, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+
+import pytest
+
+import clean_cfa_data
+import fix_dollar_signs
+import pipeline
+from batch import add_output_arguments, expand_inputs, output_version
+from math_segments import SEGMENTS_VERSION, add_segments_argument
+from rule_engine import add_guard_arguments
+
+
+def _parser():
+    parser = argparse.ArgumentParser()
+    add_output_arguments(parser, '_fixed', shard_dir=True)
+    add_segments_argument(parser)
+    add_guard_arguments(parser)
+    return parser
+
+
+@pytest.mark.parametrize('argv, suffix', [
+    ([], ''),
+    (['--compact'], '+compact'),
+    (['--segments'], '+' + SEGMENTS_VERSION),
+    (['--field-budget', '0.5'], '+guarded'),
+    (['--segments', '--compact', '--field-budget', '0.5'], f'+{SEGMENTS_VERSION}+compact+guarded'),
+    # Options that leave the output bytes alone
+    (['--force', '--output-dir', 'out', '--max-passes', '5'], ''),
+])
+def test_output_version_covers_the_output_options(argv, suffix):
+    assert output_version('rules', _parser().parse_args(argv)) == 'rules' + suffix
+
+
+def test_output_version_without_optional_options():
+    parser = argparse.ArgumentParser()
+    add_output_arguments(parser, '_cleaned')
+    assert output_version('rules', parser.parse_args(['--compact'])) == 'rules+compact'
+
+
+def test_expand_inputs_skips_reports_and_outputs(tmp_path):
+    for name in ['mock1.json', 'mock1_cleaned.json', 'mock1_cleaned.json.quarantine.jsonl',
+                 'mock1_cleaned.patch.jsonl', 'notes.txt', '.clean_manifest.json']:
+        (tmp_path / name).write_text('[]', encoding='utf-8')
+    assert expand_inputs([str(tmp_path)], include=clean_cfa_data.is_raw_bank) == \
+        [str(tmp_path / 'mock1.json')]
+    assert expand_inputs([str(tmp_path / '*.json*')]) == \
+        [str(tmp_path / 'mock1.json'), str(tmp_path / 'mock1_cleaned.json')]
+    with pytest.raises(FileNotFoundError):
+        expand_inputs([str(tmp_path / 'missing.json')])
+
+
+@pytest.mark.parametrize('main', [clean_cfa_data.main, fix_dollar_signs.main, pipeline.main])
+def test_missing_inputs_are_usage_errors(tmp_path, capsys, main):
+    missing = str(tmp_path / 'missing.json')
+    with pytest.raises(SystemExit) as exit_info:
+        main([missing])
+    assert exit_info.value.code == 2
+    assert f'no such file or directory: {missing}' in capsys.readouterr().err
@@ -0,0 +1,92 @@
+import types
+
+import pytest
+
+import clean_cfa_data
+import field_cache
+from field_cache import FieldCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A settable time.time() for the cache's last-used stamps."""
+    now = [1000]
+    monkeypatch.setattr(field_cache, 'time', types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def _size(text, value):
+    return len(text.encode('utf-8')) + len(value.encode('utf-8'))
+
+
+def test_entries_survive_reopening(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = FieldCache(path, 'v1')
+    assert cache.get('theValue') is None
+    cache.put('theValue', 'the Value')
+    assert cache.get('theValue') == 'the Value'
+    cache.close()
+
+    cache = FieldCache(path, 'v1')
+    assert cache.get('theValue') == 'the Value'
+    assert cache.take_stats() == (1, 0)
+    cache.close()
+
+
+def test_version_change_invalidates_entries(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = FieldCache(path, 'v1')
+    cache.put('theValue', 'the Value')
+    cache.close()
+
+    cache = FieldCache(path, 'v2')
+    assert cache.get('theValue') is None
+    cache.put('theValue', 'changed')
+    cache.close()
+
+    cache = FieldCache(path, 'v1')
+    assert cache.get('theValue') == 'the Value'
+    cache.close()
+
+
+def test_evicts_least_recently_used_first(tmp_path, clock):
+    cache = FieldCache(str(tmp_path / 'cache.sqlite'), 'v1')
+    for second, text in enumerate(['a' * 10, 'b' * 10, 'c' * 10]):
+        clock[0] = 1000 + second
+        cache.put(text, text.upper())
+        cache.flush()
+    # Reading the oldest entry makes it the most recently used
+    clock[0] = 2000
+    assert cache.get('a' * 10) == 'A' * 10
+    cache.flush()
+
+    cache.max_bytes = 2 * _size('a' * 10, 'A' * 10)
+    assert cache.evict() == 1
+    assert cache.get('b' * 10) is None
+    assert cache.get('a' * 10) == 'A' * 10
+    assert cache.get('c' * 10) == 'C' * 10
+    assert cache.size() <= cache.max_bytes
+    assert cache.evict() == 0
+    cache.close()
+
+
+def test_pending_entries_count_once_flushed(tmp_path):
+    cache = FieldCache(str(tmp_path / 'cache.sqlite'), 'v1', max_bytes=0)
+    cache.put('theValue', 'the Value')
+    assert cache.get('theValue') == 'the Value'
+    assert cache.evict() == 1
+    assert cache.get('theValue') is None
+    cache.close()
+
+
+def test_cached_cleaning_matches_uncached(tmp_path):
+    texts = ['theValue', 'a  b', '$[25]', 'theValue', '']
+    clean_cfa_data.open_field_cache(str(tmp_path / 'cache.sqlite'))
+    try:
+        first = [clean_cfa_data.clean_cached_field(text) for text in texts]
+        second = [clean_cfa_data.clean_cached_field(text) for text in texts]
+        # One hit for the repeated text and four on the second pass; '' is never cached
+        assert clean_cfa_data.field_cache.take_stats() == (5, 3)
+    finally:
+        clean_cfa_data.close_field_cache()
+    assert first == second == [clean_cfa_data.clean_text_field(text) for text in texts]
@@ -0,0 +1,120 @@
+import json
+import pickle
+
+import pytest
+
+import question_io
+from question_io import QUESTION_FIELDS, Question, dump_questions, iter_questions, load_questions
+
+# Items that are awkward to cut at a chunk boundary: numbers, escapes,
+# brackets and commas inside strings, nesting, non-ASCII text
+QUESTIONS = [
+    {'order_num': 1, 'question_text': 'What is 12345678?', 'option_a': '$[25]'},
+    {'order_num': 22, 'question_text': 'He said "a, b]" \\ then', 'option_a': 'é ∑ 中'},
+    {'order_num': 333, 'nested': {'list': [1, 2.5, -3e-7, None, True, False], 'empty': {}}},
+    {'order_num': 4444, 'question_text': '', 'option_a': '[{,}]'},
+    [], {}, 1234567890, 0.1, 'tail', None,
+]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 8, 13, 64, 64 * 1024])
+@pytest.mark.parametrize('indent', [None, 2])
+def test_streaming_matches_json_load(tmp_path, monkeypatch, chunk_size, indent):
+    monkeypatch.setattr(question_io, 'CHUNK_SIZE', chunk_size)
+    path = tmp_path / 'bank.json'
+    path.write_text('  \n' + json.dumps(QUESTIONS, indent=indent, ensure_ascii=False) + '\n',
+                    encoding='utf-8')
+    assert list(iter_questions(str(path))) == json.loads(path.read_text(encoding='utf-8'))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 4, 64 * 1024])
+@pytest.mark.parametrize('text', ['[]', ' [ ] ', '[\n]'])
+def test_streaming_empty_array(tmp_path, monkeypatch, chunk_size, text):
+    monkeypatch.setattr(question_io, 'CHUNK_SIZE', chunk_size)
+    path = tmp_path / 'bank.json'
+    path.write_text(text, encoding='utf-8')
+    assert list(iter_questions(str(path))) == []
+
+
+@pytest.mark.parametrize('text', ['{"order_num": 1}', '[{"order_num": 1}', '[1 2]', '[1,'])
+def test_streaming_rejects_malformed_arrays(tmp_path, monkeypatch, text):
+    monkeypatch.setattr(question_io, 'CHUNK_SIZE', 2)
+    path = tmp_path / 'bank.json'
+    path.write_text(text, encoding='utf-8')
+    with pytest.raises(ValueError):
+        list(iter_questions(str(path)))
+
+
+def test_json_lines_round_trip(tmp_path):
+    path = str(tmp_path / 'bank.jsonl')
+    questions = [q for q in QUESTIONS if isinstance(q, dict)]
+    dump_questions(questions, path)
+    assert list(iter_questions(path)) == questions
+    assert load_questions(path) == questions
+
+
+# Records in schema order, with fields missing, extra fields and keys out of order
+RECORDS = [
+    dict.fromkeys(QUESTION_FIELDS, 'x'),
+    {'order_num': 1, 'question_text': 'only two'},
+    {'order_num': 2, 'question_text': 'q', 'id': 'abc', 'option_a_segments': [{'type': 'text'}]},
+    {'question_text': 'q', 'order_num': 3, 'option_a': None},
+]
+
+
+@pytest.mark.parametrize('data', RECORDS)
+def test_pickled_records_keep_absent_fields_absent(data):
+    question = pickle.loads(pickle.dumps(Question(data)))
+    assert question.to_dict() == data
+    assert list(question.keys()) == list(data)
+    for field in QUESTION_FIELDS:
+        assert (field in question) == (field in data)
+        assert question.get(field, 'absent') == data.get(field, 'absent')
+
+
+@pytest.mark.parametrize('data', RECORDS)
+def test_records_behave_like_their_dict(data):
+    question = Question(data)
+    assert question == data
+    assert dict(question.items()) == data
+    copy = question.copy()
+    copy['option_b'] = 'changed'
+    copy['new_field'] = 1
+    assert question == data
+    assert list(copy.keys())[-1] == 'new_field'
+    with pytest.raises(KeyError):
+        question['missing_field']
+
+
+def test_records_write_like_dicts(tmp_path):
+    for name in ['bank.json', 'bank.jsonl']:
+        dicts, records = str(tmp_path / ('dicts_' + name)), str(tmp_path / ('records_' + name))
+        dump_questions(RECORDS, dicts)
+        dump_questions([Question(data) for data in RECORDS], records)
+        with open(dicts, 'rb') as a, open(records, 'rb') as b:
+            assert a.read() == b.read()
+        assert load_questions(records, records=True) == RECORDS
+
+
+# Integers orjson would read as floats, next to numbers it reads exactly
+BIG_NUMBERS = [{'order_num': 123456789012345678901234567890, 'big': [18446744073709551616,
+                -9223372036854775809, 18446744073709551615, -9223372036854775808],
+                'float': 0.1, 'text': '1234567890123456789 in a string'}]
+
+
+@pytest.mark.parametrize('name', ['bank.json', 'bank.jsonl'])
+@pytest.mark.parametrize('compact', [False, True])
+def test_integers_beyond_64_bits_stay_integers(tmp_path, name, compact):
+    path = str(tmp_path / name)
+    dump_questions(BIG_NUMBERS, path, compact)
+    assert load_questions(path) == BIG_NUMBERS
+    assert list(iter_questions(path)) == BIG_NUMBERS
+    assert load_questions(path, records=True)[0]['order_num'] == BIG_NUMBERS[0]['order_num']
+
+
+def test_default_output_of_big_integers_is_unchanged(tmp_path):
+    source = tmp_path / 'bank.json'
+    source.write_text(json.dumps(BIG_NUMBERS, indent=2, ensure_ascii=False), encoding='utf-8')
+    output = tmp_path / 'out.json'
+    dump_questions(load_questions(str(source), records=True), str(output))
+    assert output.read_bytes() == source.read_bytes()
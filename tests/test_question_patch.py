@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from question_io import load_questions
+from question_patch import apply_patch, patch_path, with_patch, write_patch
+
+OLD = [
+    {'order_num': 1, 'question_text': 'theValue', 'option_a': 'a', 'explanation_a': 'x'},
+    {'order_num': 2, 'question_text': 'unchanged', 'option_a': 'b'},
+    {'order_num': 3, 'question_text': 'dropped'},
+]
+NEW = [
+    # A changed field, a removed field and an added one
+    {'order_num': 1, 'question_text': 'the Value', 'option_a': 'a', 'option_b': 'new'},
+    {'order_num': 2, 'question_text': 'unchanged', 'option_a': 'b'},
+    {'order_num': 4, 'question_text': 'added', 'option_a': '$[25]'},
+]
+
+
+def _write(path, questions):
+    path.write_text(json.dumps(questions, indent=2, ensure_ascii=False), encoding='utf-8')
+    return str(path)
+
+
+def _round_trip(tmp_path, old, new):
+    old_file = _write(tmp_path / 'old.json', old) if old is not None else None
+    new_file = _write(tmp_path / 'new.json', new)
+    patch_file = str(tmp_path / 'new.patch.jsonl')
+    count = write_patch(old_file, new_file, patch_file)
+    output_file = str(tmp_path / 'patched.json')
+    apply_patch(old_file, patch_file, output_file)
+    return count, load_questions(output_file)
+
+
+def test_apply_of_diff_gives_the_new_file(tmp_path):
+    count, patched = _round_trip(tmp_path, OLD, NEW)
+    assert patched == NEW
+    # question_text, explanation_a, option_b, the dropped and the added question
+    assert count == 3 + 1 + 3
+
+
+def test_unchanged_file_gives_an_empty_patch(tmp_path):
+    count, patched = _round_trip(tmp_path, OLD, OLD)
+    assert count == 0
+    assert patched == OLD
+
+
+def test_full_patch_builds_from_nothing(tmp_path):
+    count, patched = _round_trip(tmp_path, None, NEW)
+    assert patched == NEW
+    assert count == sum(len(question) for question in NEW)
+
+
+def test_questions_with_an_id_are_matched_on_it(tmp_path):
+    old = [{'id': 'q1', 'order_num': 1, 'question_text': 'a'},
+           {'id': 'q2', 'order_num': 2, 'question_text': 'b'}]
+    new = [{'id': 'q1', 'order_num': 2, 'question_text': 'a'},
+           {'id': 'q2', 'order_num': 1, 'question_text': 'b'}]
+    count, patched = _round_trip(tmp_path, old, new)
+    assert patched == new
+    assert count == 2
+
+
+def test_patch_refuses_another_base(tmp_path):
+    _round_trip(tmp_path, OLD, NEW)
+    other = _write(tmp_path / 'other.json', NEW)
+    with pytest.raises(ValueError):
+        apply_patch(other, str(tmp_path / 'new.patch.jsonl'), str(tmp_path / 'out.json'))
+
+
+def test_duplicate_keys_cannot_be_patched(tmp_path):
+    old = _write(tmp_path / 'old.json', OLD)
+    new = _write(tmp_path / 'new.json', NEW + NEW[:1])
+    with pytest.raises(ValueError):
+        write_patch(old, new, str(tmp_path / 'new.patch.jsonl'))
+
+
+def test_rebuilds_write_the_patch_from_the_previous_output(tmp_path):
+    output_file = str(tmp_path / 'bank_cleaned.json')
+    versions = iter([OLD, NEW])
+    build = with_patch(lambda input_file, output: _write(tmp_path / 'bank_cleaned.json',
+                                                         next(versions)))
+    build('bank.json', output_file)
+    base = _write(tmp_path / 'base.json', OLD)
+    build('bank.json', output_file)
+
+    patched_file = str(tmp_path / 'patched.json')
+    apply_patch(base, patch_path(output_file), patched_file)
+    assert load_questions(patched_file) == load_questions(output_file) == NEW
+    assert not (tmp_path / 'bank_cleaned.json.previous').exists()
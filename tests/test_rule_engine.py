@@ -0,0 +1,152 @@
+import random
+import re
+
+import pytest
+
+import reference_cleaner
+from bench_cleaner import generate_corpus
+from clean_cfa_data import CLEANING_ENGINE, clean_text_field
+from differential import ENGINES
+from fix_dollar_signs import FIX_ENGINE, fix_dollar_signs
+from question_io import TEXT_FIELDS
+from rule_engine import SENTINEL, RuleEngine, is_linear_text, re2
+
+# Fields that each reach one stage trigger (or none) on their own
+TRIGGER_CASES = [
+    # Bare digits: every numeric repair
+    '7', 'a1b', '0176', 'x 0123 y', ' O5', '5O ', '1.0.0.5', '=10.267', 'Z=00.0882',
+    # [a-z][A-Z] joins
+    'aB', 'theValue', 'andThe', 'forX', 'thatY', 'becauseZ', 'yearA', 'YearB', 'millionY',
+    'thereforeThe', 'howeverX', 'andA', 'thisAsset',
+    # Case-insensitive words, including non-ASCII letters that fold to ASCII
+    'PROFITABILITY', 'Profitmargin', 'RISKpremium', 'Yieldcurve', '3MILLION', '4Billion',
+    'ratequityabc', 'ſtockholders', 'riſkpremium', 'marKetvalue',
+    # Spacing
+    '  ', 'a  b', 'a , b', 'x .', 'end !', 'a\tb', 'a\nb', '\n',
+    # ASCII characters only re counts as \s
+    'a\x1c, b', 'x\x1f.', 'a\v b', ' \x1eO5',
+    # No $ at all
+    'Increase', 'No change', 'Only I', 'Both I and II', 'Proportionate consolidation', 'é',
+    # Tildes and LaTeX
+    '~', '\\sim', '^{\\sim}', '\\gamma', 'times', 'alpha', '\\\\\\\\beta', 'frac', 'Big',
+    '\\times', '$\\times$', '\\approx',
+    # Dollars
+    '$', '$[25]', '[$3 million]', '[$4.5]', '[12]', 'Year $1', 'year $2', '$12', 'in $ ',
+    '(in $ ', 'in$ ', '(in$ ', '<<<DOLLAR>>>', '\\\\$', '\\\\\\\\\\$', '.$',
+    # Broken words
+    'the refore', 'theresult', 'year s', 'with in correct', 'gathe rshare holder',
+    # Math
+    'X_{1}', '(1+r)^{20}', 'a^{2}', 'a/b', '(X+Y)/(1+Z)', 'PV=(PMT+FV)/(1+Z)', 'http://a/b',
+    # Dollar fixer
+    '$profit/loss$', '0.$11/0$.08', '$(0.10-0.02)$=0.$11/0$.08', 'Year $1125$',
+    'million 20%', 'billion 5%', '[X-F$(T)/(1+r)$]', '$80=100/(1+r)$^{20}$',
+    '$(cash equivalents and short-term investments)$',
+    '$90=100/(1+Z_{12})^{12} 100/90=(1+Z_{12})^{12}$',
+    '',
+]
+
+# Every word of the original per-word loops of fix_missing_spaces and
+# fix_latex_commands, which the engine merges into alternations
+FINANCIAL_WORDS = [
+    'profit', 'loss', 'price', 'rate', 'value', 'market', 'bond', 'fund', 'asset', 'stock',
+    'company', 'investment', 'return', 'capital', 'risk', 'portfolio', 'dividend', 'coupon',
+    'maturity', 'option', 'forward', 'swap', 'derivative', 'security', 'equity', 'interest',
+    'yield', 'duration',
+]
+COMMON_WORDS = ['the', 'and', 'for', 'with', 'from', 'that', 'this', 'therefore', 'because',
+                'between']
+LATEX_COMMANDS = [
+    'times', 'div', 'frac', 'sqrt', 'sum', 'prod', 'int', 'alpha', 'beta', 'gamma', 'delta',
+    'epsilon', 'theta', 'lambda', 'mu', 'sigma', 'pi', 'leq', 'geq', 'neq', 'approx', 'sim',
+    'equiv', 'infty', 'partial', 'nabla', 'cdot', 'left', 'right', 'big', 'Big',
+]
+WORD_CASES = ([word + 'abc' for word in FINANCIAL_WORDS]
+              + [word.upper() + 'Abc' for word in FINANCIAL_WORDS]
+              + [word + 'Xyz' for word in COMMON_WORDS]
+              + [command for command in LATEX_COMMANDS]
+              + ['\\\\' + command for command in LATEX_COMMANDS])
+
+
+def _combined_cases(count: int, seed: int = 0):
+    """Fields made of several trigger cases, so stages interact."""
+    rng = random.Random(seed)
+    tokens = [case for case in TRIGGER_CASES + WORD_CASES if case]
+    return [''.join(rng.choice(tokens) + rng.choice(['', ' ']) for _ in range(rng.randint(2, 12)))
+            for _ in range(count)]
+
+
+def _synthetic_fields(count: int):
+    return [question[field] for question in generate_corpus(count)
+            for field in TEXT_FIELDS if question.get(field)]
+
+
+CORPUS = TRIGGER_CASES + WORD_CASES + _combined_cases(600) + _synthetic_fields(100)
+CLEANED = [reference_cleaner.clean_text_field(text) for text in CORPUS]
+FIXED = [reference_cleaner.fix_dollar_signs(text) for text in CLEANED]
+
+UNFILTERED_CLEAN = RuleEngine(CLEANING_ENGINE.stages, prefilter=False)
+UNFILTERED_FIX = RuleEngine(FIX_ENGINE.stages, prefilter=False)
+
+
+@pytest.mark.parametrize('text', TRIGGER_CASES)
+def test_trigger_cases_match_reference(text):
+    cleaned = reference_cleaner.clean_text_field(text)
+    assert clean_text_field(text) == cleaned
+    assert CLEANING_ENGINE.clean(text) == UNFILTERED_CLEAN.clean(text)
+    assert fix_dollar_signs(cleaned) == reference_cleaner.fix_dollar_signs(cleaned)
+    assert FIX_ENGINE.clean(text) == UNFILTERED_FIX.clean(text)
+
+
+def test_prefilter_skips_nothing_that_matches():
+    assert [CLEANING_ENGINE.clean(text) for text in CORPUS] == \
+        [UNFILTERED_CLEAN.clean(text) for text in CORPUS]
+    assert [FIX_ENGINE.clean(text) for text in CORPUS] == \
+        [UNFILTERED_FIX.clean(text) for text in CORPUS]
+
+
+def test_stage_triggers_cover_their_rules():
+    engines = [(CLEANING_ENGINE, CORPUS), (FIX_ENGINE, CLEANED)]
+    for engine, texts in engines:
+        for stage in engine.stages:
+            if stage.triggers is None:
+                continue
+            for text in texts:
+                if not any(pattern.search(text) for pattern in stage.triggers):
+                    assert stage.apply(text) == text, (stage.name, text)
+
+
+def test_engines_match_reference():
+    assert [clean_text_field(text) for text in CORPUS] == CLEANED
+    assert [fix_dollar_signs(text) for text in CLEANED] == FIXED
+
+
+@pytest.mark.parametrize('size', [1, 2, 7, 50, len(CORPUS)])
+def test_clean_batch_matches_reference(size):
+    for start in range(0, len(CORPUS), size):
+        end = start + size
+        assert CLEANING_ENGINE.clean_batch(CORPUS[start:end]) == CLEANED[start:end]
+        assert FIX_ENGINE.clean_batch(CLEANED[start:end]) == FIXED[start:end]
+
+
+def test_clean_batch_with_sentinel_in_a_field():
+    texts = ['theValue', 'a' + SENTINEL + 'b  c', '']
+    assert CLEANING_ENGINE.clean_batch(texts) == [clean_text_field(text) for text in texts]
+
+
+# RE2's \s; on ASCII text re's \s also matches \v and \x1c-\x1f
+RE2_SPACES = '\t\n\f\r '
+
+
+def test_linear_text_has_the_same_spaces_in_both_engines():
+    for code in range(128):
+        char = chr(code)
+        if is_linear_text('a' + char + 'b'):
+            assert bool(re.match(r'\s', char)) == (char in RE2_SPACES), repr(char)
+    assert not is_linear_text('a\x1c, b')
+    assert not is_linear_text('\u00e9')
+
+
+@pytest.mark.skipif(re2 is None, reason="needs google-re2")
+def test_linear_engine_matches_reference():
+    assert ENGINES['linear'](CLEANING_ENGINE, CORPUS) == CLEANED
+    assert ENGINES['linear'](FIX_ENGINE, CLEANED) == FIXED
@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from question_io import QuestionWriter
+from shards import INDEX_NAME, ShardReader, exam_name, load_index, shard_path, update_index
+
+QUESTIONS = [
+    {'order_num': 1, 'question_text': 'plain'},
+    # Multi-byte characters move every later byte offset
+    {'order_num': 2, 'question_text': 'é ∑ 中 $\\frac{1}{2}$'},
+    {'order_num': 'B3', 'question_text': 'string order_num'},
+]
+
+
+def _write_shard(shard_dir, name, questions, compact=False):
+    path = shard_path(name + '_cleaned.json', str(shard_dir))
+    with QuestionWriter(path, compact) as writer:
+        for question in questions:
+            writer.write(question)
+    return path
+
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_get_returns_the_indexed_line(tmp_path, compact):
+    path = _write_shard(tmp_path, 'mock1_section2', QUESTIONS, compact)
+    entry = update_index(str(tmp_path), path)
+    assert entry['count'] == len(QUESTIONS)
+
+    with open(path, 'rb') as f:
+        lines = [line.rstrip(b'\n') for line in f]
+    reader = ShardReader(str(tmp_path))
+    assert reader.exams == ['mock1_section2']
+    for question, line in zip(QUESTIONS, lines):
+        offset, length = entry['questions'][str(question['order_num'])]
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            assert f.read(length) == line
+        assert reader.get('mock1_section2', question['order_num']) == question
+    assert list(reader.questions('mock1_section2')) == QUESTIONS
+
+
+def test_offsets_skip_blank_and_crlf_lines(tmp_path):
+    path = tmp_path / 'mock2.jsonl'
+    lines = [json.dumps(question, ensure_ascii=False) for question in QUESTIONS]
+    path.write_bytes(('\r\n'.join(lines[:2]) + '\r\n\r\n' + lines[2] + '\n').encode('utf-8'))
+    update_index(str(tmp_path), str(path))
+    reader = ShardReader(str(tmp_path))
+    assert [reader.get('mock2', q['order_num']) for q in QUESTIONS] == QUESTIONS
+
+
+def test_index_follows_rebuilt_and_removed_shards(tmp_path):
+    first = _write_shard(tmp_path, 'mock1', QUESTIONS)
+    second = _write_shard(tmp_path, 'mock2', QUESTIONS[:1])
+    update_index(str(tmp_path), first)
+    update_index(str(tmp_path), second)
+
+    _write_shard(tmp_path, 'mock1', QUESTIONS[1:])
+    (tmp_path / 'mock2.jsonl').unlink()
+    update_index(str(tmp_path), first)
+    reader = ShardReader(str(tmp_path))
+    assert reader.exams == ['mock1']
+    assert reader.get('mock1', 2) == QUESTIONS[1]
+    with pytest.raises(KeyError):
+        reader.get('mock1', 1)
+    with pytest.raises(KeyError):
+        reader.get('mock2', 1)
+
+
+def test_duplicate_order_nums_cannot_be_indexed(tmp_path):
+    path = _write_shard(tmp_path, 'mock1', QUESTIONS + QUESTIONS[:1])
+    with pytest.raises(ValueError):
+        update_index(str(tmp_path), path)
+    assert not (tmp_path / INDEX_NAME).exists()
+
+
+def test_other_index_versions_are_refused(tmp_path):
+    (tmp_path / INDEX_NAME).write_text(json.dumps({'version': 99, 'exams': {}}), encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_index(str(tmp_path))
+
+
+def test_exam_names_drop_the_stage_suffix():
+    assert exam_name('data/mock1_section2_cleaned.json') == 'mock1_section2'
+    assert exam_name('data/mock1_section2_fixed.jsonl') == 'mock1_section2'
+    assert exam_name('data/mock1_section2.json') == 'mock1_section2'
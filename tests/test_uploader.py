@@ -0,0 +1,97 @@
+import asyncio
+import json
+import sqlite3
+
+import pytest
+
+from uploader import RetryableError, SQLiteBackend, UploadError, upload_file, upload_questions
+
+
+def _question(order_num, text='question'):
+    return {'order_num': order_num, 'question_text': f'{text} {order_num}', 'option_a': 'a',
+            'option_b': 'b', 'option_c': 'c', 'correct_option': 'A', 'explanation_a': 'x',
+            'explanation_b': 'y', 'explanation_c': 'z'}
+
+
+QUESTIONS = [_question(order_num) for order_num in range(1, 11)]
+
+
+def _rows(db_path):
+    with sqlite3.connect(db_path) as db:
+        return db.execute('SELECT id, exam_id, order_num, question_text FROM questions '
+                          'ORDER BY exam_id, order_num').fetchall()
+
+
+def _bank(tmp_path, questions):
+    path = tmp_path / 'bank_fixed.json'
+    path.write_text(json.dumps(questions), encoding='utf-8')
+    return str(path)
+
+
+def test_second_upload_is_idempotent(tmp_path):
+    db_path = str(tmp_path / 'questions.db')
+    bank = _bank(tmp_path, QUESTIONS)
+    assert upload_file(bank, 'exam-1', f'sqlite:///{db_path}', batch_size=3) == 10
+    first = _rows(db_path)
+    assert upload_file(bank, 'exam-1', f'sqlite:///{db_path}', batch_size=3) == 10
+    assert _rows(db_path) == first
+    assert [row[2] for row in first] == list(range(1, 11))
+
+
+def test_upload_updates_rows_in_place(tmp_path):
+    db_path = str(tmp_path / 'questions.db')
+    upload_file(_bank(tmp_path, QUESTIONS), 'exam-1', f'sqlite:///{db_path}')
+    upload_file(_bank(tmp_path, QUESTIONS[:5]), 'exam-2', f'sqlite:///{db_path}')
+    before = _rows(db_path)
+    edited = [_question(order_num, 'edited') for order_num in range(1, 4)]
+    upload_file(_bank(tmp_path, edited), 'exam-1', f'sqlite:///{db_path}')
+
+    after = _rows(db_path)
+    assert [row[0] for row in after] == [row[0] for row in before]
+    assert [row[3] for row in after if row[1] == 'exam-1'] == \
+        [f'edited {n}' for n in range(1, 4)] + [f'question {n}' for n in range(4, 11)]
+    assert [row[3] for row in after if row[1] == 'exam-2'] == \
+        [f'question {n}' for n in range(1, 6)]
+
+
+class FlakyBackend:
+    """Fails the first `failures` upserts with a transient error."""
+
+    def __init__(self, failures):
+        self.failures = failures
+        self.rows = []
+
+    async def upsert(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RetryableError('HTTP 503')
+        self.rows.extend(rows)
+
+
+def test_transient_failures_are_retried():
+    backend = FlakyBackend(failures=2)
+    count = asyncio.run(upload_questions(QUESTIONS, 'exam-1', backend, batch_size=4,
+                                         retries=2, backoff=0))
+    assert count == 10
+    assert sorted(row['order_num'] for row in backend.rows) == list(range(1, 11))
+
+
+def test_upload_stops_after_the_last_retry():
+    with pytest.raises(UploadError):
+        asyncio.run(upload_questions(QUESTIONS, 'exam-1', FlakyBackend(failures=100),
+                                     batch_size=4, retries=2, backoff=0))
+
+
+def test_rejected_rows_are_not_retried(tmp_path):
+    backend = SQLiteBackend(str(tmp_path / 'questions.db'))
+    invalid = [dict(_question(1), correct_option='D')]
+    try:
+        with pytest.raises(UploadError):
+            asyncio.run(upload_questions(invalid, 'exam-1', backend, backoff=0))
+    finally:
+        asyncio.run(backend.close())
+
+
+def test_duplicate_order_nums_are_refused():
+    with pytest.raises(UploadError):
+        asyncio.run(upload_questions(QUESTIONS + QUESTIONS[:1], 'exam-1', FlakyBackend(0)))
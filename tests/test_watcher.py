@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from rule_engine import RuleBudgetExceeded, disable_guard, enable_guard, guarded, load_quarantine
+from watcher import QuestionMemo
+
+QUESTIONS = [
+    {'order_num': 1, 'question_text': 'plain'},
+    {'order_num': 2, 'question_text': 'slow'},
+    {'order_num': 3, 'question_text': 'other'},
+]
+
+
+def _upper(text):
+    if 'slow' in text:
+        raise RuleBudgetExceeded('test/slow', 'over budget')
+    return text.upper()
+
+
+class Cleaner:
+    """Upper-cases question_text under the guard, counting the questions."""
+
+    def __init__(self):
+        self.cleaned = 0
+
+    def __call__(self, questions):
+        for question in questions:
+            self.cleaned += 1
+            cleaned = dict(question)
+            cleaned['question_text'] = guarded(_upper, question['question_text'],
+                                               question['order_num'], 'question_text')
+            yield cleaned
+
+
+@pytest.fixture
+def guard():
+    guard = enable_guard(seconds=None)
+    yield guard
+    disable_guard()
+
+
+def _save(path, questions):
+    path.write_text(json.dumps(questions), encoding='utf-8')
+
+
+def test_quarantined_questions_are_cleaned_again(tmp_path, guard):
+    bank = tmp_path / 'bank.json'
+    output = str(tmp_path / 'bank_cleaned.json')
+    _save(bank, QUESTIONS)
+    cleaner = Cleaner()
+    memo = QuestionMemo(cleaner)
+    memo.build(str(bank))
+    guard.write_report(output)
+
+    edited = [dict(QUESTIONS[0], question_text='edited')] + QUESTIONS[1:]
+    _save(bank, edited)
+    result = memo.build(str(bank))
+    guard.write_report(output)
+
+    assert [q['question_text'] for q in result] == ['EDITED', 'slow', 'OTHER']
+    # The edited question and the quarantined one, not the unchanged third
+    assert cleaner.cleaned == 3 + 2
+    assert [(e['order_num'], e['field']) for e in load_quarantine(output)] == \
+        [(2, 'question_text')]
+
+
+def test_prime_skips_quarantined_questions(tmp_path, guard):
+    bank = tmp_path / 'bank.json'
+    output = tmp_path / 'bank_cleaned.json'
+    _save(bank, QUESTIONS)
+    _save(output, [dict(q, question_text=q['question_text'].upper()) for q in QUESTIONS[:1]]
+          + QUESTIONS[1:2] + [dict(QUESTIONS[2], question_text='OTHER')])
+    (tmp_path / 'bank_cleaned.json.quarantine.jsonl').write_text(json.dumps(
+        {'order_num': 2, 'field': 'question_text', 'rule': 'test/slow', 'reason': 'over budget',
+         'text': 'slow'}) + '\n', encoding='utf-8')
+    cleaner = Cleaner()
+    memo = QuestionMemo(cleaner)
+    memo.prime(str(bank), str(output))
+
+    memo.build(str(bank))
+    assert cleaner.cleaned == 1
+    assert len(guard.take()) == 1
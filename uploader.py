@@ -0,0 +1,290 @@
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import queue
+import random
+import sqlite3
+import time
+import urllib.parse
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from question_io import QUESTION_FIELDS, AnyQuestion, iter_questions
+
+# Columns of the questions table filled from a question, after exam_id
+UPLOAD_COLUMNS = QUESTION_FIELDS
+# Upserts match existing rows on these columns. Supabase needs a unique
+# index for it, see docs/questions-upsert.sql.
+CONFLICT_COLUMNS = ('exam_id', 'order_num')
+
+BATCH_SIZE = 100
+CONCURRENCY = 4
+RETRIES = 5
+BACKOFF_SECONDS = 0.5
+
+# Where the seed scripts keep SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY
+ENV_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.env.local')
+
+
+class UploadError(Exception):
+    """A batch was rejected or kept failing after all retries."""
+
+
+class RetryableError(Exception):
+    """A failure worth retrying: timeouts, dropped connections, 429 and 5xx."""
+
+
+class PostgrestBackend:
+    """Multi-row upserts through the PostgREST API behind Supabase.
+
+    Keeps up to `pool_size` keep-alive HTTP connections; each upsert runs
+    on one of them in a worker thread.
+    """
+
+    def __init__(self, url: str, key: str, table: str = 'questions',
+                 pool_size: int = CONCURRENCY, timeout: float = 30.0):
+        parsed = urllib.parse.urlsplit(url)
+        self.https = parsed.scheme == 'https'
+        self.host = parsed.netloc
+        conflict = urllib.parse.quote(','.join(CONFLICT_COLUMNS))
+        self.path = f"{parsed.path.rstrip('/')}/rest/v1/{table}?on_conflict={conflict}"
+        self.headers = {
+            'apikey': key,
+            'Authorization': f'Bearer {key}',
+            'Content-Type': 'application/json',
+            'Prefer': 'resolution=merge-duplicates,return=minimal',
+        }
+        self.timeout = timeout
+        self._pool: 'queue.LifoQueue[Optional[http.client.HTTPConnection]]' = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(None)
+
+    def _connect(self) -> http.client.HTTPConnection:
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return connection_class(self.host, timeout=self.timeout)
+
+    def _post(self, body: bytes) -> None:
+        connection = self._pool.get() or self._connect()
+        try:
+            connection.request('POST', self.path, body, self.headers)
+            response = connection.getresponse()
+            detail = response.read()
+        except (OSError, http.client.HTTPException) as e:
+            connection.close()
+            connection = None
+            raise RetryableError(f'{type(e).__name__}: {e}') from e
+        finally:
+            self._pool.put(connection)
+        if response.status in (408, 429) or response.status >= 500:
+            raise RetryableError(f'HTTP {response.status}: {detail[:200]!r}')
+        if response.status >= 300:
+            raise UploadError(f'HTTP {response.status}: {detail[:500]!r}')
+
+    async def upsert(self, rows: List[Dict[str, Any]]) -> None:
+        await asyncio.to_thread(self._post, json.dumps(rows, ensure_ascii=False).encode('utf-8'))
+
+    async def close(self) -> None:
+        while not self._pool.empty():
+            connection = self._pool.get()
+            if connection is not None:
+                connection.close()
+
+
+class SQLiteBackend:
+    """Local stand-in for the questions table, for trying uploads offline.
+
+    The table mirrors docs/schema.db plus the explanation_a..c columns the
+    seed scripts fill, with the unique (exam_id, order_num) index upserts
+    rely on.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS questions (
+            id TEXT PRIMARY KEY DEFAULT (lower(hex(randomblob(16)))),
+            exam_id TEXT,
+            question_text TEXT NOT NULL,
+            option_a TEXT NOT NULL,
+            option_b TEXT NOT NULL,
+            option_c TEXT NOT NULL,
+            correct_option TEXT NOT NULL CHECK (correct_option IN ('A', 'B', 'C')),
+            order_num INTEGER NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            explanation TEXT,
+            explanation_a TEXT,
+            explanation_b TEXT,
+            explanation_c TEXT,
+            UNIQUE (exam_id, order_num)
+        )
+    """
+
+    def __init__(self, path: str, table: str = 'questions'):
+        self.path = path
+        self.table = table
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(self.SCHEMA.replace('questions', table, 1))
+        self._conn.commit()
+        # SQLite has a single writer
+        self._lock = asyncio.Lock()
+
+    def _upsert(self, rows: List[Dict[str, Any]]) -> None:
+        columns = list(rows[0])
+        placeholders = '(' + ', '.join('?' * len(columns)) + ')'
+        updates = ', '.join(f'{column} = excluded.{column}'
+                            for column in columns if column not in CONFLICT_COLUMNS)
+        sql = (f"INSERT INTO {self.table} ({', '.join(columns)}) "
+               f"VALUES {', '.join([placeholders] * len(rows))} "
+               f"ON CONFLICT ({', '.join(CONFLICT_COLUMNS)}) DO UPDATE SET {updates}")
+        try:
+            with self._conn:
+                self._conn.execute(sql, [row[column] for row in rows for column in columns])
+        except sqlite3.OperationalError as e:
+            # Locked by another process
+            raise RetryableError(str(e)) from e
+        except sqlite3.Error as e:
+            raise UploadError(str(e)) from e
+
+    async def upsert(self, rows: List[Dict[str, Any]]) -> None:
+        async with self._lock:
+            await asyncio.to_thread(self._upsert, rows)
+
+    async def close(self) -> None:
+        self._conn.close()
+
+
+def load_env_file(path: str = ENV_FILE) -> Dict[str, str]:
+    """KEY=VALUE lines of a dotenv file, like the seed scripts read."""
+    env: Dict[str, str] = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    env[key.strip()] = value.strip().strip('"\'')
+    return env
+
+
+def open_backend(target: Optional[str] = None, pool_size: int = CONCURRENCY):
+    """sqlite:///path.db for the local stand-in, an http(s) URL for PostgREST,
+    or None for SUPABASE_URL from the environment or .env.local."""
+    if target and target.startswith('sqlite:///'):
+        return SQLiteBackend(target[len('sqlite:///'):])
+    env = {**load_env_file(), **os.environ}
+    url = target or env.get('SUPABASE_URL')
+    key = env.get('SUPABASE_SERVICE_ROLE_KEY')
+    if not url or not key:
+        raise UploadError("Set SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY (environment or .env.local) "
+                          "or pass a sqlite:/// target")
+    return PostgrestBackend(url, key, pool_size=pool_size)
+
+
+def question_rows(questions: Iterable[AnyQuestion], exam_id: str,
+                  columns: Sequence[str] = UPLOAD_COLUMNS) -> Iterator[Dict[str, Any]]:
+    seen = set()
+    for question in questions:
+        order_num = question.get('order_num')
+        if order_num in seen:
+            raise UploadError(f"Duplicate order_num {order_num!r}; one upsert cannot write both")
+        seen.add(order_num)
+        row = {'exam_id': exam_id}
+        for column in columns:
+            row[column] = question.get(column)
+        yield row
+
+
+def _batches(rows: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def upload_questions(questions: Iterable[AnyQuestion], exam_id: str, backend,
+                           batch_size: int = BATCH_SIZE, concurrency: int = CONCURRENCY,
+                           retries: int = RETRIES, backoff: float = BACKOFF_SECONDS) -> int:
+    """Upsert questions into the questions table of `exam_id`.
+
+    Rows go out in multi-row batches with at most `concurrency` batches in
+    flight. Transient failures are retried up to `retries` times with
+    jittered exponential backoff; anything else stops the upload. Returns
+    the number of rows written.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def send(batch: List[Dict[str, Any]]) -> int:
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    await backend.upsert(batch)
+                    return len(batch)
+                except RetryableError as e:
+                    if attempt == retries:
+                        raise UploadError(f"Batch starting at order_num {batch[0]['order_num']} "
+                                          f"failed {retries + 1} times: {e}") from e
+                    await asyncio.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.0))
+        finally:
+            slots.release()
+
+    tasks: List[asyncio.Task] = []
+    try:
+        for batch in _batches(question_rows(questions, exam_id), batch_size):
+            await slots.acquire()
+            # Stop feeding batches as soon as one has failed for good
+            for task in tasks:
+                if task.done() and task.exception():
+                    raise task.exception()
+            tasks.append(asyncio.create_task(send(batch)))
+        return sum(await asyncio.gather(*tasks))
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+def upload_file(path: str, exam_id: str, target: Optional[str] = None,
+                batch_size: int = BATCH_SIZE, concurrency: int = CONCURRENCY,
+                retries: int = RETRIES) -> int:
+    """Upsert every question of a cleaned bank file; see upload_questions()."""
+
+    async def run() -> int:
+        backend = open_backend(target, concurrency)
+        try:
+            return await upload_questions(iter_questions(path, records=True), exam_id, backend,
+                                          batch_size, concurrency, retries)
+        finally:
+            await backend.close()
+
+    print(f"Uploading {path} to exam {exam_id}...")
+    start = time.perf_counter()
+    count = asyncio.run(run())
+    print(f"✓ Upserted {count} questions in {time.perf_counter() - start:.2f}s")
+    return count
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(
+        description="Upsert cleaned questions into the questions table of an existing exam.")
+    parser.add_argument('input', help="cleaned question bank (.json or .jsonl)")
+    parser.add_argument('--exam-id', required=True, help="id of the exam the questions belong to")
+    parser.add_argument('--target',
+                        help="sqlite:///path.db for a local stand-in, or a PostgREST/Supabase URL "
+                             "(default: SUPABASE_URL from the environment or .env.local)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="rows per upsert request (default: %(default)s)")
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help="requests in flight and pooled connections (default: %(default)s)")
+    parser.add_argument('--retries', type=int, default=RETRIES,
+                        help="retries per batch for transient errors (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    upload_file(args.input, args.exam_id, args.target, args.batch_size, args.concurrency, args.retries)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from batch import Manifest
+from question_io import TEXT_FIELDS, AnyQuestion, load_questions
+from rule_engine import active_guard, load_quarantine
+
+# Seconds between two looks at the watched files
+POLL_SECONDS = 0.1
+
+
+def _question_key(question: AnyQuestion) -> str:
+    if not isinstance(question, dict):
+        question = question.to_dict()
+    return json.dumps(question, ensure_ascii=False)
+
+
+def _quarantined_keys(questions: Dict[str, AnyQuestion],
+                      quarantined: List[Dict[str, Any]]) -> Set[str]:
+    """Keys of the raw questions with a field in the quarantine entries."""
+    fields = {(entry['order_num'], entry['field'], entry['text']) for entry in quarantined}
+    return {key for key, question in questions.items()
+            if any((question.get('order_num'), field, question.get(field)) in fields
+                   for field in TEXT_FIELDS)}
+
+
+class QuestionMemo:
+    """Cleaned questions from the last build of each file, keyed by their raw
+    JSON, so a rebuild only cleans the questions that changed since.
+
+    `clean` turns a list of raw questions into their cleaned versions, in
+    order (e.g. a clean_questions() call).
+
+    Questions with a field quarantined by the rule guard are not kept, so
+    every rebuild cleans them again and its quarantine report lists every
+    field still left uncleaned in the output.
+    """
+
+    def __init__(self, clean: Callable[[List[AnyQuestion]], Iterable[AnyQuestion]]):
+        self.clean = clean
+        self.files: Dict[str, Dict[str, AnyQuestion]] = {}
+
+    def prime(self, input_file: str, output_file: str) -> None:
+        """Remember an up to date output so the first save is incremental too."""
+        try:
+            raw = load_questions(input_file, records=True)
+            cleaned = load_questions(output_file, records=True)
+        except (OSError, ValueError):
+            return
+        if len(raw) != len(cleaned):
+            return
+        keys = [_question_key(question) for question in raw]
+        retry = _quarantined_keys(dict(zip(keys, raw)), load_quarantine(output_file))
+        self.files[input_file] = {key: c for key, c in zip(keys, cleaned) if key not in retry}
+
+    def forget(self, input_file: str) -> None:
+        self.files.pop(input_file, None)
+
+    def build(self, input_file: str) -> List[AnyQuestion]:
+        """The cleaned questions of input_file, reusing unchanged ones."""
+        previous = self.files.get(input_file, {})
+        questions = load_questions(input_file, records=True)
+        keys = [_question_key(question) for question in questions]
+        changed: Dict[str, AnyQuestion] = {}
+        for key, question in zip(keys, questions):
+            if key not in previous and key not in changed:
+                changed[key] = question
+
+        guard = active_guard()
+        reported = len(guard.quarantined) if guard is not None else 0
+        current = dict(zip(changed, self.clean(list(changed.values()))))
+        retry = _quarantined_keys(changed, guard.quarantined[reported:]) if guard is not None else set()
+        for key in keys:
+            if key not in current:
+                current[key] = previous[key]
+        self.files[input_file] = {key: c for key, c in current.items() if key not in retry}
+        print(f"  Cleaned {len(changed)} of {len(questions)} questions")
+        return [current[key] for key in keys]
+
+
+def _stat_inputs(jobs: Sequence[Tuple[str, str]]) -> Dict[str, Tuple[int, int]]:
+    stats = {}
+    for input_file, _ in jobs:
+        try:
+            stat = os.stat(input_file)
+        except FileNotFoundError:
+            continue
+        stats[input_file] = (stat.st_mtime_ns, stat.st_size)
+    return stats
+
+
+def watch(list_jobs: Callable[[], List[Tuple[str, str]]], build: Callable[[str, str], None],
+          version: str, manifest_name: str, memo: Optional[QuestionMemo] = None,
+          interval: float = POLL_SECONDS) -> None:
+    """Rebuild an output whenever its input is saved, until interrupted.
+
+    `list_jobs` is called on every poll so files added to a watched
+    directory are picked up. Inputs are polled by modification time and
+    size; each rebuild is logged with its latency and recorded in the build
+    manifest. A file that fails to load (e.g. while the editor is still
+    writing it) is retried on its next save.
+    """
+    jobs = dict(list_jobs())
+    seen = _stat_inputs(list(jobs.items()))
+    if memo is not None:
+        for input_file, output_file in jobs.items():
+            memo.prime(input_file, output_file)
+    print(f"Watching {len(jobs)} file(s), Ctrl-C to stop...")
+
+    try:
+        while True:
+            time.sleep(interval)
+            try:
+                jobs = dict(list_jobs())
+            except FileNotFoundError as e:
+                print(f"⚠ {e} disappeared, still watching")
+                continue
+            current = _stat_inputs(list(jobs.items()))
+            if memo is not None:
+                for input_file in set(seen) - set(current):
+                    memo.forget(input_file)
+            changed = [path for path, stat in current.items() if seen.get(path) != stat]
+            seen = current
+
+            for input_file in changed:
+                output_file = jobs[input_file]
+                start = time.perf_counter()
+                try:
+                    build(input_file, output_file)
+                except (OSError, ValueError) as e:
+                    print(f"⚠ {input_file} not rebuilt: {e}")
+                    continue
+                manifest = Manifest(os.path.join(os.path.dirname(os.path.abspath(output_file)),
+                                                 manifest_name))
+                manifest.record(input_file, output_file, version)
+                manifest.save()
+                elapsed = (time.perf_counter() - start) * 1000
+                print(f"✓ {time.strftime('%H:%M:%S')} {output_file} rebuilt in {elapsed:.1f} ms")
+    except KeyboardInterrupt:
+        print("Stopped watching")